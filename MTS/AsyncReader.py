@@ -0,0 +1,17 @@
+"""
+Read several MTS chains at once on one asyncio event loop (Python 3.7 or later).
+
+Each device is opened non-blocking and watched with loop.add_reader(), so idle ports cost
+nothing until bytes arrive; each gets its own FrameParser. Frames from all ports come
+out of one async iterator, tagged with their source and a monotonic receive time in ns.
+
+    async with AsyncReader({'lc2': '/dev/cu.usbserial', 'ssi4': '/dev/cu.UC-232AC'}) as reader:
+        async for source, received, frame in reader:
+            ...
+"""
+import sys
+
+if sys.version_info < (3, 7):
+    raise ImportError('MTS.AsyncReader needs Python 3.7 or later')
+
+from MTS._async_reader import AsyncReader, SourcedFrame, open_port
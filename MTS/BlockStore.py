@@ -0,0 +1,480 @@
+"""
+Seekable block-compressed capture storage.
+
+Consecutive ISP2 frames are nearly identical, so captures compress very well. Frames are
+grouped into independent blocks so that reading any packet only needs one block
+decompressed.
+
+Layout (all integers little endian):
+
+    file header   MAGIC, codec, flags
+    block         header (first packet, packet count, raw size, compressed size) + payload
+                  payload is the frames back to back, or with FLAG_RUNS a repeat count
+                  (uint32) in front of each distinct frame
+                  with FLAG_GAPS the bytes that are not part of a frame (line noise, a
+                  frame cut off at the end) are kept where they came: as they are between
+                  the frames, or with FLAG_RUNS as a zero repeat count and a byte count
+                  (uint32) in front of them
+    ...
+    block index   one entry per block: first packet, packet count, raw size, compressed size, offset
+    footer        index offset, block count, END_MAGIC
+
+The per-block headers make a file whose footer never got written (power loss mid capture)
+readable by walking the blocks.
+
+Expanding a capture written with its gaps gives back the original bytes exactly.
+"""
+from __future__ import print_function, division
+import bisect
+import io
+import struct
+import zlib
+
+from MTS.Dedup import RunSequence
+from MTS.stream import FrameParser, frame_length
+
+MAGIC = b'ISP2BLK1'
+END_MAGIC = b'ISP2END1'
+
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODECS = {'zlib': CODEC_ZLIB, 'lzma': CODEC_LZMA}
+
+# File flags
+FLAG_RUNS = 0x01  # identical consecutive frames are stored once with a repeat count
+FLAG_GAPS = 0x02  # bytes between frames and a trailing partial frame are stored too
+
+_FILE_HEADER = struct.Struct('<8sBBH')
+_BLOCK_HEADER = struct.Struct('<QIII')
+_INDEX_ENTRY = struct.Struct('<QIIIQ')
+_FOOTER = struct.Struct('<QQ8s')
+_REPEAT = struct.Struct('<I')
+
+
+def _lzma():
+    try:
+        import lzma
+    except ImportError:
+        raise ValueError('lzma blocks need Python 3')
+    return lzma
+
+
+def _compressor(codec, level):
+    if codec == CODEC_ZLIB:
+        return lambda data: zlib.compress(data, level)
+    if codec == CODEC_LZMA:
+        lzma = _lzma()
+        return lambda data: lzma.compress(data, preset=level)
+    raise ValueError('Unknown codec {}'.format(codec))
+
+
+def _decompressor(codec):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress
+    if codec == CODEC_LZMA:
+        return _lzma().decompress
+    raise ValueError('Unknown codec {}'.format(codec))
+
+
+def is_block_file(head):
+    """
+    :param head: at least the first 8 bytes of a file
+    """
+    return head[:len(MAGIC)] == MAGIC
+
+
+def _split_frames(data):
+    frames = []
+    position = 0
+    view = bytearray(data)
+    while position + 1 < len(data):
+        end = position + frame_length((view[position] << 8) | view[position + 1])
+        frames.append(data[position:end])
+        position = end
+    return frames
+
+
+def _split_stream(data):
+    # Captured bytes: (frame, 1) per frame, (gap, 0) for the bytes that are not a frame
+    gaps = []
+    parser = FrameParser(gaps=gaps)
+    frames = parser.feed(data)
+    records = []
+    for gap, frame in zip(gaps, frames):
+        if gap:
+            records.append((gap, 0))
+        records.append((frame, 1))
+    tail = parser.tail()
+    if tail:
+        records.append((tail, 0))
+    return records
+
+
+def _split_runs(data):
+    # (frame, repeat count) per run, (gap, 0) for the bytes that are not a frame
+    records = []
+    position = 0
+    view = bytearray(data)
+    while position + _REPEAT.size < len(data):
+        count, = _REPEAT.unpack_from(data, position)
+        position += _REPEAT.size
+        if count:
+            end = position + frame_length((view[position] << 8) | view[position + 1])
+        else:
+            size, = _REPEAT.unpack_from(data, position)
+            position += _REPEAT.size
+            end = position + size
+        records.append((data[position:end], count))
+        position = end
+    return records
+
+
+def _gap_record(gap):
+    return _REPEAT.pack(0) + _REPEAT.pack(len(gap)) + gap
+
+
+def _with_gaps(frames, gaps):
+    # Frames with the gaps back in front of the packets they came before
+    n = -1
+    for n, frame in enumerate(frames):
+        if n in gaps:
+            yield gaps[n]
+        yield frame
+    if n + 1 in gaps:
+        yield gaps[n + 1]
+
+
+def _run_records(frame_runs, gaps):
+    # Payload records of a FLAG_RUNS block; a gap splits the run it falls in
+    positions = sorted(gaps)
+    g = 0
+    position = 0
+    for frame, count in frame_runs:
+        end = position + count
+        while g < len(positions) and positions[g] < end:
+            at = positions[g]
+            if at > position:
+                yield _REPEAT.pack(at - position) + frame
+                position = at
+            yield _gap_record(gaps[at])
+            g += 1
+        yield _REPEAT.pack(end - position) + frame
+        position = end
+    for at in positions[g:]:
+        yield _gap_record(gaps[at])
+
+
+class Block(object):
+    __slots__ = ('first_packet', 'packets', 'raw_size', 'compressed_size', 'offset')
+
+    def __init__(self, first_packet, packets, raw_size, compressed_size, offset):
+        self.first_packet = first_packet
+        self.packets = packets
+        self.raw_size = raw_size
+        self.compressed_size = compressed_size
+        self.offset = offset
+
+
+class BlockWriter(object):
+    """
+    Write raw frames to a block-compressed capture; close() writes the index.
+    With dedup=True repeated frames are stored as runs (frames_per_block then counts runs).
+    Bytes between frames go in with write_gap() (see MTS.stream.read_gaps_and_frames),
+    so the capture expands back byte for byte.
+    """
+
+    def __init__(self, outstream, codec='zlib', level=6, frames_per_block=1024, dedup=False):
+        super(BlockWriter, self).__init__()
+        self._out = outstream
+        self._codec = CODECS[codec]
+        self._compress = _compressor(self._codec, level)
+        self.frames_per_block = frames_per_block
+        self._dedup = dedup
+        self._pending = RunSequence()
+        # Packet position in the pending block: bytes stored just before it
+        self._gaps = {}
+        self._blocks = []
+        self._position = 0
+        self.packets = 0
+        self.gap_bytes = 0
+        self._write(_FILE_HEADER.pack(MAGIC, self._codec, FLAG_GAPS | (FLAG_RUNS if dedup else 0), 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, data):
+        self._out.write(data)
+        self._position += len(data)
+
+    def write(self, frame, repeat=1):
+        """
+        :param repeat: number of consecutive packets carrying this frame
+        """
+        pending = self._pending
+        if self._dedup:
+            if pending.run_count() >= self.frames_per_block and pending.frames[-1] != frame:
+                self._write_block()
+        elif len(pending) >= self.frames_per_block:
+            self._write_block()
+        self._pending.extend([(frame, repeat)])
+        return len(frame)
+
+    def write_gap(self, data):
+        """
+        Store bytes that are not a frame where they came in the stream, ahead of the next frame
+        """
+        if data:
+            position = len(self._pending)
+            self._gaps[position] = self._gaps.get(position, b'') + data
+            self.gap_bytes += len(data)
+        return len(data)
+
+    def _write_block(self):
+        pending = self._pending
+        if self._dedup:
+            raw = b''.join(_run_records(pending.runs(), self._gaps))
+        else:
+            raw = b''.join(_with_gaps(pending.expand(), self._gaps))
+        packets = len(pending)
+        self._pending = RunSequence()
+        self._gaps = {}
+        payload = self._compress(raw)
+        self._write(_BLOCK_HEADER.pack(self.packets, packets, len(raw), len(payload)))
+        self._blocks.append(Block(self.packets, packets, len(raw), len(payload), self._position))
+        self._write(payload)
+        self.packets += packets
+
+    def flush(self):
+        """
+        Close off the current (possibly short) block
+        """
+        if self._pending or self._gaps:
+            self._write_block()
+        self._out.flush()
+
+    def close(self):
+        self.flush()
+        index_offset = self._position
+        for b in self._blocks:
+            self._write(_INDEX_ENTRY.pack(b.first_packet, b.packets, b.raw_size, b.compressed_size, b.offset))
+        self._write(_FOOTER.pack(index_offset, len(self._blocks), END_MAGIC))
+        self._out.flush()
+
+
+class BlockReader(object):
+    """
+    Random access to the frames of a block-compressed capture.
+    """
+
+    def __init__(self, instream):
+        super(BlockReader, self).__init__()
+        self._in = instream
+        instream.seek(0)
+        magic, codec, self.flags, _ = _FILE_HEADER.unpack(instream.read(_FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('Not a block capture')
+        self.codec = codec
+        self._decompress = _decompressor(codec)
+        self.blocks = self._read_index()
+        self._firsts = [b.first_packet for b in self.blocks]
+        self._cached = None
+        self._cached_data = None
+        self._cached_records = None
+        self._cached_frames = None
+        self._cached_offsets = None
+
+    @classmethod
+    def open(cls, path):
+        return cls(io.open(path, mode='rb'))
+
+    def close(self):
+        self._in.close()
+
+    def __len__(self):
+        if not self.blocks:
+            return 0
+        last = self.blocks[-1]
+        return last.first_packet + last.packets
+
+    def _read_index(self):
+        instream = self._in
+        end = instream.seek(0, io.SEEK_END)
+        if end >= _FILE_HEADER.size + _FOOTER.size:
+            instream.seek(end - _FOOTER.size)
+            index_offset, count, magic = _FOOTER.unpack(instream.read(_FOOTER.size))
+            if magic == END_MAGIC:
+                instream.seek(index_offset)
+                data = instream.read(count * _INDEX_ENTRY.size)
+                return [
+                    Block(*_INDEX_ENTRY.unpack_from(data, i * _INDEX_ENTRY.size))
+                    for i in range(count)
+                ]
+        return self._walk_blocks(end)
+
+    def _walk_blocks(self, end):
+        # No footer; recover the index from the block headers, up to the first one that
+        # cannot be a whole block: cut off, or the start of a partly written index
+        blocks = []
+        total = 0
+        position = _FILE_HEADER.size
+        while position + _BLOCK_HEADER.size <= end:
+            self._in.seek(position)
+            first, packets, raw_size, compressed_size = _BLOCK_HEADER.unpack(self._in.read(_BLOCK_HEADER.size))
+            offset = position + _BLOCK_HEADER.size
+            if first != total or not raw_size or not compressed_size or offset + compressed_size > end:
+                break
+            try:
+                if len(self._decompress(self._in.read(compressed_size))) != raw_size:
+                    break
+            except Exception:
+                # zlib.error, lzma.LZMAError: not a payload
+                break
+            blocks.append(Block(first, packets, raw_size, compressed_size, offset))
+            total += packets
+            position = offset + compressed_size
+        return blocks
+
+    def block_number(self, packet_number):
+        if not 0 <= packet_number < len(self):
+            raise IndexError('packet {} out of range'.format(packet_number))
+        return bisect.bisect_right(self._firsts, packet_number) - 1
+
+    def _load(self, block_number):
+        if self._cached == block_number:
+            return
+        b = self.blocks[block_number]
+        self._in.seek(b.offset)
+        data = self._decompress(self._in.read(b.compressed_size))
+        if self.flags & FLAG_RUNS:
+            self._cached_records = _split_runs(data)
+            self._cached_data = None
+        else:
+            if self.flags & FLAG_GAPS:
+                self._cached_records = _split_stream(data)
+            else:
+                self._cached_records = [(frame, 1) for frame in _split_frames(data)]
+            self._cached_data = data
+        self._cached_frames = None
+        self._cached_offsets = None
+        self._cached = block_number
+
+    def read_block(self, block_number):
+        """
+        :return: the decompressed (and run-expanded) bytes of one block, gaps included
+        """
+        self._load(block_number)
+        if self._cached_data is None:
+            self._cached_data = b''.join([data * count if count else data for data, count in self._cached_records])
+        return self._cached_data
+
+    def block_runs(self, block_number):
+        """
+        :return: (frame, repeat count) pairs of one block
+        """
+        self._load(block_number)
+        return [(frame, count) for frame, count in self._cached_records if count]
+
+    def block_frames(self, block_number):
+        """
+        :return: the frames of one block, one entry per packet
+        """
+        self._load(block_number)
+        if self._cached_frames is None:
+            frames = []
+            for frame, count in self._cached_records:
+                frames.extend([frame] * count)
+            self._cached_frames = frames
+        return self._cached_frames
+
+    def block_offsets(self, block_number):
+        """
+        :return: where each packet of one block starts in read_block()
+        """
+        self._load(block_number)
+        if self._cached_offsets is None:
+            offsets = []
+            position = 0
+            for data, count in self._cached_records:
+                for _ in range(count):
+                    offsets.append(position)
+                    position += len(data)
+                if not count:
+                    position += len(data)
+            self._cached_offsets = offsets
+        return self._cached_offsets
+
+    def frame(self, packet_number):
+        block_number = self.block_number(packet_number)
+        return self.block_frames(block_number)[packet_number - self.blocks[block_number].first_packet]
+
+    def frames(self, start=0):
+        if start >= len(self):
+            return
+        block_number = self.block_number(start)
+        skip = start - self.blocks[block_number].first_packet
+        for n in range(block_number, len(self.blocks)):
+            for frame in self.block_frames(n)[skip:]:
+                yield frame
+            skip = 0
+
+    def runs(self):
+        """
+        (frame, repeat count) pairs for the whole capture; a run may be split at block boundaries
+        """
+        for n in range(len(self.blocks)):
+            for run in self.block_runs(n):
+                yield run
+
+
+class BlockStream(io.RawIOBase):
+    """
+    The decompressed byte stream of a block capture, read sequentially like the original file.
+    Wrap it in io.BufferedReader to hand it to read_packets()/read_frames().
+    """
+
+    def __init__(self, instream):
+        super(BlockStream, self).__init__()
+        self.reader = BlockReader(instream)
+        self._block = 0
+        self._data = b''
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seek_packet(self, packet_number):
+        """
+        Position the stream at the start of a packet; only its block is decompressed
+        """
+        self._block = self.reader.block_number(packet_number)
+        self._data = self.reader.read_block(self._block)
+        skip = packet_number - self.reader.blocks[self._block].first_packet
+        self._position = self.reader.block_offsets(self._block)[skip]
+        self._block += 1
+
+    def readinto(self, b):
+        while self._position >= len(self._data):
+            if self._block >= len(self.reader.blocks):
+                return 0
+            self._data = self.reader.read_block(self._block)
+            self._position = 0
+            self._block += 1
+        count = min(len(b), len(self._data) - self._position)
+        b[:count] = self._data[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self.reader.close()
+        super(BlockStream, self).close()
+
+
+def open_blocks(instream):
+    """
+    :return: a buffered, file-like view of the decompressed capture
+    """
+    return io.BufferedReader(BlockStream(instream))
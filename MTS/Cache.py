@@ -0,0 +1,152 @@
+"""
+Content-addressed cache of decoded sessions.
+
+Entries are keyed by a hash of the capture's bytes plus DECODER_VERSION, so editing
+a capture or changing the decoder simply misses. Least recently used entries are
+evicted once the cache directory grows past its size limit.
+"""
+from __future__ import print_function, division
+import hashlib
+import io
+import os
+import struct
+import sys
+import tempfile
+
+from MTS import DECODER_VERSION
+from MTS.Columns import Columns, decode_file
+from MTS.Timing import timestamps_for
+
+DEFAULT_DIRECTORY = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'pyMTS'
+)
+SUFFIX = '.columns'
+
+
+def content_key(path, chunk_size=1 << 20):
+    """
+    :return: hex digest of the file contents and the decoder version
+    """
+    digest = hashlib.sha1()
+    digest.update('decoder={:d};'.format(DECODER_VERSION).encode('ascii'))
+    with io.open(path, mode='rb') as instream:
+        while 1:
+            chunk = instream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DecodeCache(object):
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=256 * 1024 * 1024):
+        super(DecodeCache, self).__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        """
+        :rtype: MTS.Columns.Columns or None
+        """
+        path = self._path(key)
+        try:
+            with io.open(path, mode='rb') as instream:
+                columns = Columns.load(instream)
+        except (IOError, OSError, ValueError, struct.error):
+            return None
+        # Recency for LRU eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return columns
+
+    def put(self, key, columns):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with io.open(handle, mode='wb') as out:
+                columns.dump(out)
+            # Atomic, so a concurrent reader never sees half an entry
+            os.rename(temp_path, self._path(key))
+        except Exception:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def entries(self):
+        """
+        :return: (last used, size, path) of each entry, least recently used first
+        """
+        result = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return result
+        for name in names:
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, path))
+        return sorted(result)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError as e:
+                print('Failed to evict {}: {}'.format(path, e), file=sys.stderr)
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.unlink(path)
+
+    def load(self, path):
+        """
+        Decoded columns for a capture, from the cache when this exact content was seen before
+        :rtype: MTS.Columns.Columns
+        """
+        key = content_key(path)
+        columns = self.get(key)
+        if columns is not None:
+            self.hits += 1
+            # Stamps live in their own sidecar and are not cached
+            columns.received = timestamps_for(path, len(columns))
+            return columns
+        self.misses += 1
+        columns = decode_file(path)
+        try:
+            self.put(key, columns)
+        except (IOError, OSError) as e:
+            print('Failed to cache {}: {}'.format(path, e), file=sys.stderr)
+        return columns
+
+
+def load_session(path, cache=None):
+    """
+    Decoded columns for a capture, using the default cache unless one is given
+    :rtype: MTS.Columns.Columns
+    """
+    if cache is None:
+        cache = DecodeCache()
+    return cache.load(path)
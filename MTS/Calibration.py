@@ -0,0 +1,204 @@
+"""
+Per-channel conversion of 10 bit aux values to engineering units.
+
+Each calibration is evaluated once for all 1024 possible aux values; converting a sample
+is then a table lookup, the same cost whether the curve is a line or a 5th order fit.
+Calibrations are declared per channel (1 based, as on the SSI-4) in settings.json:
+
+    "calibrations": {
+        "aux1": {"name": "map", "units": "kPa", "linear": {"scale": 50.0, "offset": -20.0}},
+        "aux2": {"name": "oil", "units": "psi", "polynomial": [-12.5, 25.0, 0.4]},
+        "aux3": {"name": "egt", "units": "C", "table": [[0.0, 0], [1.25, 250], [5.0, 1250]]}
+    }
+
+The input to each curve is volts unless the channel says "input": "raw" (0..1023).
+Polynomial coefficients start with the constant term; table points are (input, output)
+pairs, interpolated linearly and held at the end values outside their range.
+"""
+from __future__ import print_function, division
+import array
+import bisect
+import keyword
+import os
+import re
+
+from MTS.Packet import AuxBits
+from MTS.Query import NAMES
+
+VOLTS = 'volts'
+RAW = 'raw'
+
+TABLE_SIZE = AuxBits.MAX_VALUE + 1
+
+_CHANNEL_KEY = re.compile(r'^aux(\d+)$')
+_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def linear(scale=1.0, offset=0.0):
+    return lambda x: x * scale + offset
+
+
+def polynomial(coefficients):
+    """
+    :param coefficients: constant term first
+    """
+    coefficients = list(coefficients)
+    if not coefficients:
+        raise ValueError('Polynomial needs at least one coefficient')
+
+    def evaluate(x):
+        result = 0.0
+        for c in reversed(coefficients):
+            result = result * x + c
+        return result
+    return evaluate
+
+
+def piecewise(points):
+    """
+    :param points: (input, output) pairs
+    """
+    points = sorted((float(x), float(y)) for x, y in points)
+    if len(points) < 2:
+        raise ValueError('Table needs at least two points')
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    if len(set(xs)) != len(xs):
+        raise ValueError('Table has repeated input values')
+
+    def evaluate(x):
+        if x <= xs[0]:
+            return ys[0]
+        if x >= xs[-1]:
+            return ys[-1]
+        i = bisect.bisect_right(xs, x)
+        x0, x1, y0, y1 = xs[i - 1], xs[i], ys[i - 1], ys[i]
+        return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return evaluate
+
+
+class Calibration(object):
+    """
+    A curve compiled into a lookup table indexed by the raw aux value
+    """
+
+    def __init__(self, function, name=None, units='', source=VOLTS):
+        super(Calibration, self).__init__()
+        if source not in (VOLTS, RAW):
+            raise ValueError('Unknown calibration input: {}'.format(source))
+        self.name = name
+        self.units = units
+        self.source = source
+        scale = AuxBits.MAX_VOLTS / AuxBits.MAX_VALUE if source == VOLTS else 1
+        self.table = array.array('d', [float(function(raw * scale)) for raw in range(TABLE_SIZE)])
+
+    def __call__(self, raw):
+        """
+        :param raw: 10 bit aux value, or an AuxBits
+        """
+        if isinstance(raw, AuxBits):
+            raw = raw.aux()
+        return self.table[raw]
+
+    @classmethod
+    def from_settings(cls, spec, name=None):
+        """
+        :param spec: one channel's entry from the settings "calibrations" section
+        """
+        kinds = [kind for kind in ('linear', 'polynomial', 'table') if kind in spec]
+        if len(kinds) != 1:
+            raise ValueError('Calibration {} needs exactly one of linear, polynomial or table'.format(name))
+        kind = kinds[0]
+        if kind == 'linear':
+            function = linear(spec['linear'].get('scale', 1.0), spec['linear'].get('offset', 0.0))
+        elif kind == 'polynomial':
+            function = polynomial(spec['polynomial'])
+        else:
+            function = piecewise(spec['table'])
+        return cls(function, name=spec.get('name', name), units=spec.get('units', ''),
+                   source=spec.get('input', VOLTS))
+
+
+class Calibrations(object):
+    """
+    Calibrations by aux channel (0 based)
+    """
+
+    def __init__(self, channels=None):
+        super(Calibrations, self).__init__()
+        self.channels = dict(channels or {})
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __contains__(self, channel):
+        return channel in self.channels
+
+    def __getitem__(self, channel):
+        return self.channels[channel]
+
+    def get(self, channel, default=None):
+        return self.channels.get(channel, default)
+
+    def items(self):
+        return sorted(self.channels.items())
+
+    def by_name(self, name):
+        """
+        :return: (channel, calibration) for the channel called name, or None
+        """
+        for channel, calibration in self.channels.items():
+            if calibration.name == name:
+                return channel, calibration
+        return None
+
+    def values(self, packet):
+        """
+        :type packet: MTS.Packet.Packet
+        :return: {name: value} for every calibrated channel the packet carries
+        """
+        channels = packet.aux_channels()
+        return dict(
+            (calibration.name, calibration.table[channels[channel].aux()])
+            for channel, calibration in self.channels.items() if channel < len(channels)
+        )
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        :param settings: the whole settings mapping; only "calibrations" is read
+        """
+        channels = {}
+        for key, spec in (settings.get('calibrations') or {}).items():
+            match = _CHANNEL_KEY.match(key)
+            if match is None or int(match.group(1)) < 1:
+                raise ValueError('Calibration key {!r} is not aux1, aux2, ...'.format(key))
+            calibration = Calibration.from_settings(spec, name=key)
+            _check_name(calibration.name, key)
+            channels[int(match.group(1)) - 1] = calibration
+        names = [c.name for c in channels.values()]
+        if len(set(names)) != len(names):
+            raise ValueError('Calibration names must be unique')
+        return cls(channels)
+
+
+def _check_name(name, key):
+    """
+    A calibration name is a query name, so it must parse as one and not hide a built in
+    name or another channel's auxN
+    """
+    if not _NAME.match(name) or keyword.iskeyword(name) or name in ('None', 'True', 'False'):
+        raise ValueError('Calibration name {!r} is not usable in queries'.format(name))
+    if name in NAMES or (name.startswith('aux') and name != key):
+        raise ValueError('Calibration name {!r} is reserved in queries'.format(name))
+
+
+def load_calibrations(path='settings.json'):
+    """
+    :return: Calibrations from the settings file; empty when it has none or is missing
+    :rtype: Calibrations
+    """
+    from termapp.settings import Settings
+    if not os.path.exists(path):
+        return Calibrations()
+    return Calibrations.from_settings(Settings(path=path))
@@ -0,0 +1,365 @@
+"""
+Live capture fan-out: one reader thread frames the serial input and hands every frame
+to any number of sinks. Each sink drains its own bounded queue on its own worker thread,
+so a slow console, disk or forwarding port can only ever lose its own frames, never
+stall the serial read.
+"""
+from __future__ import print_function, division
+import collections
+import io
+import logging
+import select
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from MTS.Packet import PACKET_INTERVAL, format_packet
+from MTS.stream import FrameParser, decode_frame, read_size
+from MTS.Timing import BYTE_NS, TimingStats, monotonic_ns, stamp_frames
+
+_log = logging.getLogger('capture')
+
+# Backpressure policies when a sink's queue is full
+DROP_OLDEST = 'drop-oldest'  # discard the oldest queued frame; the sink stays current
+DROP_NEWEST = 'drop-newest'  # discard the incoming frame; the sink sees an unbroken prefix
+BLOCK = 'block'  # wait for room; stalls the reader, so only for offline (file) input
+
+_STOP = object()
+
+SinkStats = collections.namedtuple('SinkStats', 'name queued received processed dropped errors latency')
+
+
+class Sink(object):
+    """
+    Base class for a capture consumer; subclasses implement handle().
+    """
+
+    def __init__(self, name, maxsize=256, policy=DROP_OLDEST):
+        super(Sink, self).__init__()
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError('Unknown policy: {}'.format(policy))
+        self.name = name
+        self.policy = policy
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        # Seconds between the reader receiving a frame and this sink handling it
+        self.latency = 0.0
+
+    def offer(self, item):
+        """
+        Called from the reader thread; never blocks unless the policy is BLOCK.
+        :type item: tuple of (index, received time in monotonic ns, frame)
+        """
+        self.received += 1
+        if self.policy == BLOCK:
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        if self.policy == DROP_OLDEST:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sink-{}'.format(self.name))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Let the worker drain what is queued, then close the sink
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        try:
+            while 1:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                index, received, frame = item
+                try:
+                    self.handle(index, received, frame)
+                except Exception as e:
+                    self.errors += 1
+                    _log.warning('Sink %s failed on packet %d: %s', self.name, index, e)
+                self.processed += 1
+                self.latency = (monotonic_ns() - received) / 1e9
+        finally:
+            self.close()
+
+    def handle(self, index, received, frame):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return SinkStats(
+            self.name, self._queue.qsize(), self.received, self.processed,
+            self.dropped, self.errors, self.latency
+        )
+
+
+class RawFileSink(Sink):
+    """
+    Append raw ISP2 frames to an open binary stream (or a CaptureWriter), flushing every
+    flush_every frames; None leaves flushing to the stream. A CaptureWriter with
+    timestamps on also gets each frame's receive stamp.
+    """
+
+    def __init__(self, outstream, name='raw', flush_every=100, **kwargs):
+        super(RawFileSink, self).__init__(name, **kwargs)
+        self._out = outstream
+        self._flush_every = flush_every
+        self._timestamped = getattr(outstream, 'timestamps', False)
+
+    def handle(self, index, received, frame):
+        if self._timestamped:
+            self._out.write(frame, received)
+        else:
+            self._out.write(frame)
+        if self._flush_every and index % self._flush_every == 0:
+            self._out.flush()
+
+    def close(self):
+        self._out.flush()
+
+
+class DecodedSink(Sink):
+    """
+    Decode every frame and pass (index, packet) to a callback
+    """
+
+    def __init__(self, callback, name='decoded', **kwargs):
+        super(DecodedSink, self).__init__(name, **kwargs)
+        self._callback = callback
+
+    def handle(self, index, received, frame):
+        self._callback(index, decode_frame(frame))
+
+
+class RingBufferSink(Sink):
+    """
+    Keep the most recent decoded packets for a display to poll
+    """
+
+    def __init__(self, size=64, name='display', **kwargs):
+        super(RingBufferSink, self).__init__(name, **kwargs)
+        self._ring = collections.deque(maxlen=size)
+
+    def handle(self, index, received, frame):
+        self._ring.append((index, decode_frame(frame)))
+
+    def latest(self, count=None):
+        """
+        :return: up to count most recent (index, packet) pairs, oldest first
+        """
+        snapshot = list(self._ring)
+        if count is not None:
+            snapshot = snapshot[-count:]
+        return snapshot
+
+
+class TimingSink(Sink):
+    """
+    Gaps and inter-arrival jitter of the live stream; see MTS.Timing.TimingStats
+    """
+
+    def __init__(self, name='timing', interval=PACKET_INTERVAL, **kwargs):
+        kwargs.setdefault('maxsize', 4096)
+        super(TimingSink, self).__init__(name, **kwargs)
+        self.timing = TimingStats(interval)
+
+    def handle(self, index, received, frame):
+        self.timing.feed(received, index)
+
+
+class ForwardSink(Sink):
+    """
+    Pass frames through unchanged to another port, e.g. a replay or display device
+    """
+
+    def __init__(self, port, name='forward', **kwargs):
+        super(ForwardSink, self).__init__(name, **kwargs)
+        self._port = port
+
+    def handle(self, index, received, frame):
+        self._port.write(frame)
+
+
+class CapturePipeline(object):
+    """
+    Single reader, many sinks.
+
+    With live=True an empty read (serial timeout) is treated as an idle line rather
+    than end of stream; the reader then only stops through stop(). A live port that
+    counts its waiting bytes and has a file descriptor is only read once select() says
+    it is readable, waiting at most poll seconds at a time, so a port opened without a
+    read timeout cannot hold the reader past stop(); after an empty read the reader
+    rests poll seconds instead of spinning.
+
+    Each frame is stamped with when its last byte arrived, worked back from the time of
+    the read that completed it at byte_ns per byte (see MTS.Timing.stamp_frames).
+    """
+
+    def __init__(self, instream, sinks=(), live=False, chunk_size=io.DEFAULT_BUFFER_SIZE, byte_ns=BYTE_NS,
+                 poll=0.1):
+        super(CapturePipeline, self).__init__()
+        self._in = instream
+        self._live = live
+        self._fileno = _fileno(instream) if live else None
+        self._poll = poll
+        self._wake = threading.Event()
+        self._chunk_size = chunk_size
+        self._byte_ns = byte_ns
+        self._sinks = list(sinks)
+        self._running = False
+        self._reader = None
+        self._offsets = []
+        self.parser = FrameParser(offsets=self._offsets)
+        self.frames = 0
+
+    def add_sink(self, sink):
+        self._sinks.append(sink)
+        if self._running:
+            sink.start()
+        return sink
+
+    def start(self):
+        """
+        Start the sinks and the reader thread; returns immediately
+        """
+        self._start_sinks()
+        self._reader = threading.Thread(target=self._read, name='capture-reader')
+        self._reader.daemon = True
+        self._reader.start()
+
+    def run(self):
+        """
+        Read on the calling thread until the input ends (or stop() is called), then drain the sinks
+        """
+        self._start_sinks()
+        try:
+            self._read()
+        finally:
+            self._stop_sinks()
+
+    def stop(self, timeout=1.0):
+        """
+        Stop reading and drain the sinks, waiting at most timeout seconds for each thread
+        """
+        self._running = False
+        self._wake.set()
+        if self._reader is not None:
+            self._reader.join(timeout)
+            if self._reader.is_alive():
+                _log.warning('Capture reader still blocked in read(); leaving it behind')
+            self._reader = None
+        self._stop_sinks(timeout)
+
+    def join(self, timeout=None):
+        if self._reader is not None:
+            self._reader.join(timeout)
+
+    def _start_sinks(self):
+        self._running = True
+        self._wake.clear()
+        for sink in self._sinks:
+            sink.start()
+
+    def _stop_sinks(self, timeout=None):
+        for sink in self._sinks:
+            sink.stop(timeout)
+
+    def _readable(self):
+        """
+        :return: False when poll seconds passed with nothing to read
+        """
+        if self._fileno is None or self._in.in_waiting:
+            return True
+        return bool(select.select([self._fileno], [], [], self._poll)[0])
+
+    def _read(self):
+        instream = self._in
+        parser = self.parser
+        offsets = self._offsets
+        previous = 0
+        while self._running:
+            if self._live and not self._readable():
+                continue
+            chunk = instream.read(read_size(instream, self._chunk_size))
+            if not chunk:
+                if self._live:
+                    self._wake.wait(self._poll)
+                    continue
+                break
+            received = monotonic_ns()
+            frames = parser.feed(chunk)
+            stamps = stamp_frames(received, frames, offsets, parser.position(), previous, self._byte_ns)
+            del offsets[:]
+            for stamp, frame in zip(stamps, frames):
+                self._dispatch(stamp, frame)
+            if stamps:
+                previous = stamps[-1]
+
+    def _dispatch(self, received, frame):
+        item = (self.frames, received, frame)
+        for sink in self._sinks:
+            sink.offer(item)
+        self.frames += 1
+
+    def stats(self):
+        return [sink.stats() for sink in self._sinks]
+
+    def report(self, outstream=sys.stderr):
+        print('frames={:d} skipped={:d}'.format(self.frames, self.parser.skipped), file=outstream)
+        for s in self.stats():
+            print(' {s.name}: queued={s.queued:d} processed={s.processed:d} dropped={s.dropped:d} '
+                  'errors={s.errors:d} lag={ms:.1f}ms'.format(s=s, ms=s.latency * 1000), file=outstream)
+
+
+def _fileno(instream):
+    """
+    :return: the descriptor to select() on before reading, or None to just read
+    """
+    # Only ports that count their waiting bytes: a buffered stream can hold bytes its
+    # descriptor no longer shows
+    if getattr(instream, 'in_waiting', None) is None:
+        return None
+    try:
+        return instream.fileno()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def console_sink(outstream=sys.stdout, **kwargs):
+    """
+    Decoded packets printed in the dumper format
+    """
+    def show(index, packet):
+        print(format_packet(index, packet), file=outstream)
+    kwargs.setdefault('name', 'console')
+    return DecodedSink(show, **kwargs)
@@ -0,0 +1,179 @@
+from __future__ import print_function, division
+import io
+import os
+import threading
+import time
+
+from MTS import Timing
+
+
+class CaptureWriter(object):
+    """
+    Raw ISP2 capture files, written in large batches and rotated by size and/or age.
+
+    Frames are stored exactly as they arrive on the wire (big endian words), so every
+    file can be replayed or decoded directly. Files are named
+    <prefix>-<YYYYmmdd-HHMMSS>-<sequence><suffix> from the time they were opened.
+
+    Durability:
+      batch_bytes     write to the OS once this many bytes are buffered ...
+      max_delay       ... or once the oldest buffered frame is this many seconds old, checked
+                      by a timer thread as well, so a batch is not held back when input stops
+      fsync_interval  None: leave it to the OS; 0: fsync every batch; N: fsync at most every N seconds
+
+    With timestamps on, every capture gets a <capture>.ts sidecar holding each frame's
+    receive stamp (see MTS.Timing), written and rotated together with the frames. Only
+    turn them on for live input; frames read back from a file carry no arrival times.
+    """
+
+    def __init__(self, directory='.', prefix='capture', suffix='.ISP2',
+                 batch_bytes=64 * 1024, max_delay=1.0,
+                 max_bytes=None, max_seconds=None, fsync_interval=None,
+                 timestamps=False, clock=time.time):
+        super(CaptureWriter, self).__init__()
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.batch_bytes = batch_bytes
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_interval = fsync_interval
+        self.timestamps = timestamps
+        self._clock = clock
+        self._batch = bytearray()
+        self._batch_started = None
+        self._stamps = Timing.ns_array()
+        self._file = None
+        self._stamp_file = None
+        self._file_bytes = 0
+        self._opened = None
+        self._last_sync = None
+        self._sequence = 0
+        self._lock = threading.RLock()
+        self._closing = threading.Event()
+        self._flusher = None
+        self.path = None
+        self.paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _name(self, opened):
+        return '{}-{}-{:03d}{}'.format(
+            self.prefix, time.strftime('%Y%m%d-%H%M%S', time.localtime(opened)), self._sequence, self.suffix
+        )
+
+    def _open(self, now):
+        self._sequence += 1
+        self.path = os.path.join(self.directory, self._name(now))
+        # Buffered, so each write() takes the whole batch; _write_batch() flushes it
+        self._file = io.open(self.path, mode='wb')
+        if self.timestamps:
+            self._stamp_file = io.open(Timing.sidecar_path(self.path), mode='wb')
+            self._stamp_file.write(Timing.MAGIC)
+        self._file_bytes = 0
+        self._opened = now
+        self._last_sync = now
+        self.paths.append(self.path)
+        if self.max_delay is not None and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_late, name='capture-flush')
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def _flush_late(self):
+        while not self._closing.wait(self.max_delay):
+            with self._lock:
+                now = self._clock()
+                if self._batch and now - self._batch_started >= self.max_delay:
+                    self._write_batch(now)
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        if self.fsync_interval is not None:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        if self._stamp_file is not None:
+            if self.fsync_interval is not None:
+                os.fsync(self._stamp_file.fileno())
+            self._stamp_file.close()
+            self._stamp_file = None
+
+    def rotate(self):
+        """
+        Write out what is buffered and start a new file with the next frame
+        """
+        with self._lock:
+            self._write_batch(self._clock())
+            self._close_file()
+
+    def write(self, frame, received=None):
+        """
+        :param frame: one complete raw frame, header word included
+        :type frame: bytes
+        :param received: monotonic receive stamp in ns; now when not given
+        """
+        with self._lock:
+            return self._write(frame, received)
+
+    def _write(self, frame, received):
+        now = self._clock()
+        if self._file is None:
+            self._open(now)
+        elif self.max_seconds is not None and now - self._opened >= self.max_seconds:
+            self.rotate()
+            self._open(now)
+        if self.max_bytes is not None and \
+                self._file_bytes + len(self._batch) + len(frame) > self.max_bytes and \
+                self._file_bytes + len(self._batch) > 0:
+            self.rotate()
+            self._open(now)
+
+        if not self._batch:
+            self._batch_started = now
+        self._batch.extend(frame)
+        if self.timestamps:
+            self._stamps.append(received if received is not None else Timing.monotonic_ns())
+        if len(self._batch) >= self.batch_bytes or \
+                (self.max_delay is not None and now - self._batch_started >= self.max_delay):
+            self._write_batch(now)
+        return len(frame)
+
+    def _write_batch(self, now):
+        if not self._batch or self._file is None:
+            return
+        self._file.write(bytes(self._batch))
+        self._file.flush()
+        self._file_bytes += len(self._batch)
+        del self._batch[:]
+        if self._stamp_file is not None:
+            Timing.write_timestamps(self._stamp_file, self._stamps)
+            self._stamp_file.flush()
+            del self._stamps[:]
+        if self.fsync_interval is not None and now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            if self._stamp_file is not None:
+                os.fsync(self._stamp_file.fileno())
+            self._last_sync = now
+
+    def flush(self):
+        """
+        Hand everything buffered to the OS, honouring the fsync policy
+        """
+        with self._lock:
+            self._write_batch(self._clock())
+
+    def close(self):
+        if self._flusher is not None:
+            self._closing.set()
+            self._flusher.join()
+            self._flusher = None
+            self._closing.clear()
+        with self._lock:
+            self._write_batch(self._clock())
+            self._close_file()
@@ -0,0 +1,248 @@
+"""
+Column-oriented decode of a whole session: one compact array per field instead of a
+Packet (and its SubPacket unions) per frame.
+"""
+from __future__ import print_function, division
+import array
+import io
+import struct
+import sys
+
+from MTS import FUNCTION_LAMBDA_MASK, FUNCTION_LM_MASK, FUNCTION_LM
+from MTS.BlockStore import BlockReader, FLAG_RUNS, is_block_file
+from MTS.Dedup import runs
+from MTS.Packet import Functions, AuxBits
+from MTS.stream import captured_stream, frame_words, read_frames
+from MTS.Timing import packet_times, timestamps_for
+
+NO_FUNCTION = -1  # function column value for packets without a lambda sub-packet
+NO_AUX = 0xFFFF  # aux column value for packets without that channel
+
+FUNCTION_CODES = dict((name, code) for code, name in Functions.items())
+_MAGIC = b'ISP2COL1'
+_COLUMN_HEADER = struct.Struct('<16scI')
+
+
+def _tobytes(values):
+    return values.tostring() if sys.version_info[0] < 3 else values.tobytes()
+
+
+def _frombytes(values, data):
+    if sys.version_info[0] < 3:
+        values.fromstring(data)
+    else:
+        values.frombytes(data)
+
+
+class Columns(object):
+    """
+    Decoded packet fields, one array per column; row n is packet n.
+
+      header        header word
+      function      function code (see Packet.Functions), NO_FUNCTION without lambda
+      lambda_value  L12..L0, 0 without lambda
+      multiplier    AFR multiplier AF7..0, 0 without lambda
+      aux[c]        10 bit aux value of channel c (0 based), NO_AUX when absent
+
+    received holds the capture's receive stamps (ns) when it has a timestamp sidecar, else
+    None; it is not part of dump() and load().
+    """
+
+    def __init__(self):
+        super(Columns, self).__init__()
+        self.header = array.array('H')
+        self.function = array.array('b')
+        self.lambda_value = array.array('H')
+        self.multiplier = array.array('H')
+        self.aux = []
+        self.received = None
+
+    def __len__(self):
+        return len(self.header)
+
+    def append(self, frame, count=1):
+        """
+        Decode one raw frame into count new rows
+        """
+        words = frame_words(frame)
+        row = len(self.header)
+        self.header.append(words[0])
+        auxstart = 1
+        lc1 = len(words) > 2 and words[1] & FUNCTION_LAMBDA_MASK == FUNCTION_LAMBDA_MASK
+        if lc1 or (len(words) > 2 and words[1] & FUNCTION_LM_MASK == FUNCTION_LM):
+            # LC-1 and LM-1 share the function and lambda word layout
+            self.function.append((words[1] >> 10) & 0b111)
+            self.multiplier.append(((words[1] & 0x0100) >> 1) | (words[1] & 0x007F))
+            self.lambda_value.append(((words[2] & 0x3F00) >> 1) | (words[2] & 0x007F))
+            auxstart = 3
+            # Battery word, ahead of the aux channels; an LM-1 always sends one
+            if len(words) > 3 and (not lc1 or words[3] & 0x3800 != 0):
+                auxstart = 4
+        else:
+            self.function.append(NO_FUNCTION)
+            self.multiplier.append(0)
+            self.lambda_value.append(0)
+
+        aux = self.aux
+        for channel, word in enumerate(words[auxstart:]):
+            if channel == len(aux):
+                aux.append(array.array('H', [NO_AUX]) * row)
+            aux[channel].append(((word & 0x0700) >> 1) | (word & 0x007F))
+        for channel in range(len(words) - auxstart, len(aux)):
+            aux[channel].append(NO_AUX)
+        if count > 1:
+            for values in [self.header, self.function, self.lambda_value, self.multiplier] + aux:
+                values.extend(values[-1:] * (count - 1))
+
+    def extend(self, frames):
+        # Idle and warmup stretches repeat one frame; decode it once per run
+        self.extend_runs(runs(frames))
+
+    def extend_runs(self, frame_runs):
+        """
+        :param frame_runs: (frame, repeat count) pairs, see MTS.Dedup
+        """
+        for frame, count in frame_runs:
+            self.append(frame, count)
+
+    def time(self):
+        """
+        :return: milliseconds since the first packet, per row; from the receive stamps
+            when there are any, else packet number * PACKET_INTERVAL
+        """
+        return packet_times(len(self), self.received)
+
+    def function_names(self):
+        return [Functions[f] if f != NO_FUNCTION else None for f in self.function]
+
+    def afr(self):
+        """
+        Air/fuel ratio per row as Packet.air_fuel_ratio() computes it; NaN where it has none
+        """
+        nan = float('nan')
+        normal, o2, warmup = FUNCTION_CODES['Normal'], FUNCTION_CODES['O2'], FUNCTION_CODES['Warmup']
+        result = array.array('d')
+        for f, l, m in zip(self.function, self.lambda_value, self.multiplier):
+            if f == normal:
+                result.append((l + 500) * m / 10000)
+            elif f == o2 or f == warmup:
+                result.append(l / 10.0)
+            else:
+                result.append(nan)
+        return result
+
+    def channels(self):
+        return len(self.aux)
+
+    def raw(self, channel):
+        return self.aux[channel]
+
+    def volts(self, channel):
+        """
+        NaN where the channel is absent
+        """
+        scale = AuxBits.MAX_VOLTS / AuxBits.MAX_VALUE
+        nan = float('nan')
+        return array.array('d', [v * scale if v != NO_AUX else nan for v in self.aux[channel]])
+
+    def calibrated(self, channel, calibration):
+        """
+        Channel values through a calibration's lookup table; NaN where the channel is absent
+        :type calibration: MTS.Calibration.Calibration
+        """
+        table = calibration.table
+        nan = float('nan')
+        return array.array('d', [table[v] if v != NO_AUX else nan for v in self.aux[channel]])
+
+    def rpm(self, channel):
+        """
+        0 where the channel is absent
+        """
+        factor = AuxBits.RPM_FACTOR
+        return array.array('L', [v * factor if v != NO_AUX else 0 for v in self.aux[channel]])
+
+    def _named_columns(self):
+        columns = [
+            ('header', self.header),
+            ('function', self.function),
+            ('lambda_value', self.lambda_value),
+            ('multiplier', self.multiplier),
+        ]
+        columns.extend(('aux{:d}'.format(c), values) for c, values in enumerate(self.aux))
+        return columns
+
+    def dump(self, outstream):
+        """
+        Write every column in a compact binary form; see load()
+        """
+        columns = self._named_columns()
+        outstream.write(_MAGIC + struct.pack('<I', len(columns)))
+        for name, values in columns:
+            values = array.array(values.typecode, values)
+            if sys.byteorder != 'little':
+                values.byteswap()
+            outstream.write(_COLUMN_HEADER.pack(name.encode('ascii'), values.typecode.encode('ascii'), len(values)))
+            outstream.write(_tobytes(values))
+
+    @classmethod
+    def load(cls, instream):
+        """
+        :rtype: Columns
+        """
+        if instream.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('Not a columns file')
+        count, = struct.unpack('<I', instream.read(4))
+        result = cls()
+        aux = []
+        for _ in range(count):
+            name, typecode, length = _COLUMN_HEADER.unpack(instream.read(_COLUMN_HEADER.size))
+            name = name.rstrip(b'\0').decode('ascii')
+            values = array.array(typecode.decode('ascii'))
+            size = length * values.itemsize
+            data = instream.read(size)
+            if len(data) != size:
+                raise ValueError('Truncated column {}'.format(name))
+            _frombytes(values, data)
+            if sys.byteorder != 'little':
+                values.byteswap()
+            if name.startswith('aux'):
+                aux.append((int(name[3:]), values))
+            else:
+                setattr(result, name, values)
+        result.aux = [values for _, values in sorted(aux)]
+        return result
+
+
+def decode_columns(frames):
+    """
+    :type frames: iterable of raw frames
+    :rtype: Columns
+    """
+    columns = Columns()
+    columns.extend(frames)
+    return columns
+
+
+def decode_file(path):
+    """
+    Decode a whole capture (raw or block-compressed) into columns
+    :rtype: Columns
+    """
+    if not isinstance(path, (list, tuple)) and _is_run_blocks(path):
+        # Stored as runs already; no need to expand them
+        columns = Columns()
+        with io.open(path, mode='rb') as instream:
+            columns.extend_runs(BlockReader(instream).runs())
+    else:
+        with captured_stream(path) as instream:
+            columns = decode_columns(read_frames(instream, chunk_size=64 * io.DEFAULT_BUFFER_SIZE))
+    if not isinstance(path, (list, tuple)):
+        columns.received = timestamps_for(path, len(columns))
+    return columns
+
+
+def _is_run_blocks(path):
+    with io.open(path, mode='rb') as instream:
+        if not is_block_file(instream.read(8)):
+            return False
+        return bool(BlockReader(instream).flags & FLAG_RUNS)
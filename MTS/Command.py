@@ -0,0 +1,258 @@
+"""
+Send commands up an MTS chain while the data stream keeps running.
+
+A CommandChannel is a CapturePipeline over the serial port: its reader hands data frames
+to the sinks as usual and takes command response frames (header bit 12 clear) out of the
+stream, completing the oldest pending request for that command. Commands are written by
+their own thread, so several can be in flight and callers never touch the port.
+
+    channel = CommandChannel(port, sinks=[console_sink()])
+    channel.start()
+    names = channel.send(NAMELIST).result(timeout=1.0).data
+
+Only in-band (Serial Protocol 2) commands go through here. The out-of-band serial mode
+exchanges captured in cap/ ('S', 'n') stop packet generation and are answered
+with raw bytes rather than frames. MTS.FakeDevice plays both kinds back from those captures.
+"""
+from __future__ import print_function, division
+import collections
+import io
+import logging
+import struct
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from MTS.Capture import CapturePipeline
+from MTS.Timing import monotonic_ns
+
+_log = logging.getLogger('command')
+
+# Command characters (ISP2 section 4)
+SYNCHRONIZE = b'H'
+START_RECORDING = b'R'
+END_RECORDING = b'r'
+ERASE_RECORDING = b'e'
+CALIBRATE = b'c'
+LISTEN = b'\xcc'
+UNLISTEN = b'\xec'
+NAMELIST = b'\xce'
+TYPELIST = b'\xf3'
+
+# Commands answered with a command response packet; the rest are done once written
+RESPONDS = frozenset(ord(c) for c in (LISTEN, UNLISTEN, NAMELIST, TYPELIST))
+
+# Header high byte: bit 12 set for sensor data, clear for a command response
+DATA_BIT = 0x10
+
+_STOP = object()
+
+# data: response bytes after the command word
+Response = collections.namedtuple('Response', 'command received data')
+
+
+class CommandTimeout(RuntimeError):
+    pass
+
+
+class ChannelClosed(RuntimeError):
+    pass
+
+
+def listen(name):
+    """
+    Listen command for the device called name (at most 8 characters)
+    :rtype: bytes
+    """
+    name = name.encode('ascii') if not isinstance(name, bytes) else name
+    if len(name) > 8:
+        raise ValueError('Device name longer than 8 characters: {!r}'.format(name))
+    return LISTEN + name.ljust(8, b'\x00')
+
+
+def is_response(frame):
+    return not ord(frame[0:1]) & DATA_BIT
+
+
+def response_command(frame):
+    """
+    Command a response frame answers; bits 0..6 and 7..13 of the command sit in bits 0..6
+    and 8..14 of the first word after the header
+    :rtype: int or None
+    """
+    if len(frame) < 4:
+        return None
+    word = (ord(frame[2:3]) << 8) | ord(frame[3:4])
+    return (word & 0x007F) | ((word & 0x7F00) >> 1)
+
+
+def response_frame(command, data=b''):
+    """
+    The command response frame a device sends for command; data is padded to whole words
+    :type command: int
+    :rtype: bytes
+    """
+    body = struct.pack('>H', ((command & 0x3F80) << 1) | (command & 0x007F)) + data + b'\x00' * (len(data) % 2)
+    words = len(body) // 2
+    # Header bits 15, 13, 9 and 7 with bit 12 (data) clear
+    return struct.pack('>H', 0xA280 | ((words & 0x0080) << 1) | (words & 0x007F)) + body
+
+
+class CommandRequest(object):
+    """
+    A queued command; result() waits for it to be written and, if the command has one,
+    for its response
+    """
+
+    def __init__(self, channel, payload):
+        super(CommandRequest, self).__init__()
+        self.payload = bytes(payload)
+        self.command = ord(self.payload[0:1])
+        self.expects_response = self.command in RESPONDS
+        self.queued = monotonic_ns()
+        self.sent = None
+        self._channel = channel
+        self._done = threading.Event()
+        self._response = None
+        self._error = None
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        :return: the response, or None for commands without one
+        :rtype: Response
+        """
+        if not self._done.wait(timeout):
+            self._channel.cancel(self)
+            raise CommandTimeout('No response to command 0x{:02X} after {}s'.format(self.command, timeout))
+        if self._error is not None:
+            raise self._error
+        return self._response
+
+    def _complete(self, response=None, error=None):
+        self._response = response
+        self._error = error
+        self._done.set()
+
+
+class CommandChannel(CapturePipeline):
+    """
+    Capture pipeline that can also send commands up the chain.
+
+    Requests waiting for the same command are answered in the order they were sent;
+    response frames nobody is waiting for are counted in unmatched and dropped.
+    """
+
+    def __init__(self, port, sinks=(), live=True, chunk_size=io.DEFAULT_BUFFER_SIZE, maxsize=64):
+        super(CommandChannel, self).__init__(port, sinks, live=live, chunk_size=chunk_size)
+        self._port = port
+        self._outbox = queue.Queue(maxsize)
+        self._pending = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._writer = None
+        self.responses = 0
+        self.unmatched = 0
+
+    def send(self, command, data=b''):
+        """
+        Queue a command; blocks only while maxsize commands are already waiting to be written
+        :param command: command character, e.g. NAMELIST
+        :param data: additional bytes, e.g. the device name of a listen command
+        :rtype: CommandRequest
+        """
+        request = CommandRequest(self, command + data)
+        if self._writer is None:
+            raise ChannelClosed('Command channel is not running')
+        self._outbox.put(request)
+        return request
+
+    def cancel(self, request):
+        with self._lock:
+            waiting = self._pending.get(request.command)
+            if waiting and request in waiting:
+                waiting.remove(request)
+
+    def start(self):
+        self._start_writer()
+        super(CommandChannel, self).start()
+
+    def run(self):
+        self._start_writer()
+        try:
+            super(CommandChannel, self).run()
+        finally:
+            self._stop_writer()
+
+    def stop(self, timeout=None):
+        super(CommandChannel, self).stop(timeout)
+        self._stop_writer(timeout)
+
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._write, name='command-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _stop_writer(self, timeout=None):
+        if self._writer is None:
+            return
+        writer, self._writer = self._writer, None
+        self._outbox.put(_STOP)
+        writer.join(timeout)
+        # Requests still queued were never written; fail them along with those awaiting a response
+        unsent = []
+        while 1:
+            try:
+                request = self._outbox.get_nowait()
+            except queue.Empty:
+                break
+            if request is not _STOP:
+                unsent.append(request)
+        if writer.is_alive():
+            # Stuck in a write; let it exit once that returns
+            self._outbox.put(_STOP)
+        with self._lock:
+            waiting = [request for requests in self._pending.values() for request in requests]
+            self._pending.clear()
+        for request in unsent + waiting:
+            request._complete(error=ChannelClosed('Command channel stopped'))
+
+    def _write(self):
+        port = self._port
+        while 1:
+            request = self._outbox.get()
+            if request is _STOP:
+                break
+            if request.expects_response:
+                # Registered before writing; the response can arrive before write() returns
+                with self._lock:
+                    self._pending[request.command].append(request)
+            try:
+                port.write(request.payload)
+                port.flush()
+            except Exception as e:
+                self.cancel(request)
+                request._complete(error=e)
+                continue
+            request.sent = monotonic_ns()
+            if not request.expects_response:
+                request._complete()
+
+    def _dispatch(self, received, frame):
+        if not is_response(frame):
+            super(CommandChannel, self)._dispatch(received, frame)
+            return
+        self.responses += 1
+        command = response_command(frame)
+        with self._lock:
+            waiting = self._pending.get(command)
+            request = waiting.popleft() if waiting else None
+        if request is None:
+            self.unmatched += 1
+            _log.info('Unexpected response to command %s', command)
+            return
+        request._complete(Response(command, received, frame[4:]))
@@ -0,0 +1,129 @@
+"""
+Run-length deduplication of identical consecutive frames.
+
+While idling or warming up the chain repeats the same frame for long stretches; a run
+keeps one copy of the frame and a repeat count. Packet numbers (and so packet times)
+stay exact: packet n is the frame of the run that covers n.
+"""
+from __future__ import print_function, division
+import array
+import bisect
+
+from MTS.stream import decode_frame
+from MTS.Timing import PacketClock
+
+
+def runs(frames):
+    """
+    Collapse identical consecutive frames
+    :return: (frame, repeat count) pairs
+    """
+    previous = None
+    count = 0
+    for frame in frames:
+        if frame == previous:
+            count += 1
+            continue
+        if count:
+            yield previous, count
+        previous = frame
+        count = 1
+    if count:
+        yield previous, count
+
+
+def expand(frame_runs):
+    """
+    Lossless inverse of runs()
+    """
+    for frame, count in frame_runs:
+        for _ in range(count):
+            yield frame
+
+
+class RunSequence(object):
+    """
+    In-memory session of runs with packet-number access. Each distinct run is decoded
+    at most once, however many packets it covers.
+    """
+
+    def __init__(self, frame_runs=(), stamps=None):
+        """
+        :param stamps: receive stamps of the packets, for time_of (see MTS.Timing.packet_clock)
+        """
+        super(RunSequence, self).__init__()
+        self.frames = []
+        # Packet number one past the end of each run
+        self._ends = array.array('L')
+        self._packets = {}
+        self.clock = PacketClock(stamps)
+        self.extend(frame_runs)
+
+    @classmethod
+    def from_frames(cls, frames, stamps=None):
+        return cls(runs(frames), stamps=stamps)
+
+    def append(self, frame):
+        """
+        Add one frame, extending the last run when it repeats
+        """
+        if self.frames and self.frames[-1] == frame:
+            self._ends[-1] += 1
+        else:
+            self.frames.append(frame)
+            self._ends.append(len(self) + 1)
+
+    def extend(self, frame_runs):
+        for frame, count in frame_runs:
+            if self.frames and self.frames[-1] == frame:
+                self._ends[-1] += count
+            else:
+                self.frames.append(frame)
+                self._ends.append(len(self) + count)
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def run_count(self):
+        return len(self.frames)
+
+    def run_of(self, packet_number):
+        """
+        :return: index of the run that covers a packet
+        """
+        if not 0 <= packet_number < len(self):
+            raise IndexError('packet {} out of range'.format(packet_number))
+        return bisect.bisect_right(self._ends, packet_number)
+
+    def run_span(self, run):
+        """
+        :return: (first packet, packet count) of a run
+        """
+        first = self._ends[run - 1] if run else 0
+        return first, self._ends[run] - first
+
+    def frame(self, packet_number):
+        return self.frames[self.run_of(packet_number)]
+
+    def packet(self, packet_number):
+        """
+        Decoded packet; shared by every packet of the same run, so treat it as read-only
+        :rtype: MTS.Packet.Packet
+        """
+        run = self.run_of(packet_number)
+        if run not in self._packets:
+            self._packets[run] = decode_frame(self.frames[run])
+        return self._packets[run]
+
+    def time_of(self, packet_number):
+        """
+        :return: milliseconds since the first packet
+        """
+        return self.clock.time_of(packet_number)
+
+    def runs(self):
+        for run, frame in enumerate(self.frames):
+            yield frame, self.run_span(run)[1]
+
+    def expand(self):
+        return expand(self.runs())
@@ -0,0 +1,299 @@
+"""
+Single-pass event detection over a packet stream.
+
+Every registered detector sees each packet once, in order, and keeps only the state of
+the interval it is tracking, so memory stays constant however long the session. The same
+engine runs over a file or alongside a live capture (see EventSink).
+"""
+from __future__ import print_function, division
+import collections
+
+from MTS.Capture import Sink
+from MTS.Packet import PACKET_INTERVAL
+from MTS.stream import captured_stream, decode_frame, read_frames
+from MTS.Timing import capture_stamps, packet_clock
+
+# time: ms since the first packet; packet: packet number where the event starts
+Event = collections.namedtuple('Event', 'time packet kind detail')
+
+
+class Detector(object):
+    """
+    Base class; feed() sees every packet and returns any events it completes.
+    """
+    kind = 'event'
+
+    def feed(self, packet_number, time, packet):
+        """
+        :type packet: MTS.Packet.Packet
+        :rtype: list of Event or None
+        """
+        raise NotImplementedError
+
+    def finish(self, packet_number, time):
+        """
+        End of stream; close anything still open
+        :rtype: list of Event or None
+        """
+        return None
+
+
+class IntervalDetector(Detector):
+    """
+    Emits one event per stretch of consecutive packets for which active() holds, when the
+    stretch ends. Stretches shorter than min_packets are ignored.
+    """
+
+    def __init__(self, min_packets=1):
+        super(IntervalDetector, self).__init__()
+        self.min_packets = min_packets
+        self._start = None
+
+    def active(self, packet):
+        raise NotImplementedError
+
+    def begin(self, packet):
+        """
+        Called on the first packet of a stretch; reset per-interval state here
+        """
+        pass
+
+    def update(self, packet):
+        """
+        Called on every packet of a stretch, the first included
+        """
+        pass
+
+    def detail(self):
+        return {}
+
+    def feed(self, packet_number, time, packet):
+        if self.active(packet):
+            if self._start is None:
+                self._start = (packet_number, time)
+                self.begin(packet)
+            self.update(packet)
+            return None
+        return self._close(packet_number, time)
+
+    def finish(self, packet_number, time):
+        return self._close(packet_number, time)
+
+    def _close(self, packet_number, time):
+        if self._start is None:
+            return None
+        start_packet, start_time = self._start
+        self._start = None
+        if packet_number - start_packet < self.min_packets:
+            return None
+        detail = dict(self.detail(), duration=time - start_time, packets=packet_number - start_packet)
+        return [Event(start_time, start_packet, self.kind, detail)]
+
+
+class WarmupDetector(IntervalDetector):
+    """
+    How long the sensor took to reach operating temperature
+    """
+    kind = 'warmup'
+
+    def active(self, packet):
+        return packet.function() == 'Warmup'
+
+    def begin(self, packet):
+        self._percent = packet.lambda_value() / 10.0
+
+    def detail(self):
+        return {'from_percent': self._percent}
+
+
+class FunctionTransitionDetector(Detector):
+    """
+    Entering or leaving any of the watched functions (Packet.Functions names)
+    """
+    kind = 'function'
+
+    def __init__(self, functions=('Error', 'Cal Required')):
+        super(FunctionTransitionDetector, self).__init__()
+        self.functions = frozenset(functions)
+        self._previous = None
+
+    def feed(self, packet_number, time, packet):
+        function = packet.function()
+        previous, self._previous = self._previous, function
+        if function == previous:
+            return None
+        if function in self.functions or previous in self.functions:
+            detail = {'from': previous, 'to': function}
+            if function == 'Error':
+                detail['code'] = packet.lambda_value()
+            return [Event(time, packet_number, self.kind, detail)]
+        return None
+
+
+class AfrExcursionDetector(Detector):
+    """
+    Lean (AFR above lean) or rich (AFR below rich) stretches in Normal function
+    """
+
+    def __init__(self, lean=15.5, rich=11.5, min_packets=3):
+        super(AfrExcursionDetector, self).__init__()
+        self.lean = lean
+        self.rich = rich
+        self.min_packets = min_packets
+        self._kind = None
+        self._start = None
+        self._peak = None
+
+    def _classify(self, packet):
+        if packet.function() != 'Normal':
+            return None, None
+        afr = packet.air_fuel_ratio()
+        if afr > self.lean:
+            return 'lean', afr
+        if afr < self.rich:
+            return 'rich', afr
+        return None, afr
+
+    def feed(self, packet_number, time, packet):
+        kind, afr = self._classify(packet)
+        if kind == self._kind:
+            if kind is not None:
+                self._peak = max(self._peak, afr) if kind == 'lean' else min(self._peak, afr)
+            return None
+        events = self._close(packet_number, time)
+        if kind is not None:
+            self._kind = kind
+            self._start = (packet_number, time)
+            self._peak = afr
+        return events
+
+    def finish(self, packet_number, time):
+        return self._close(packet_number, time)
+
+    def _close(self, packet_number, time):
+        kind, self._kind = self._kind, None
+        if kind is None:
+            return None
+        start_packet, start_time = self._start
+        if packet_number - start_packet < self.min_packets:
+            return None
+        return [Event(start_time, start_packet, kind, {
+            'duration': time - start_time, 'packets': packet_number - start_packet, 'peak': self._peak
+        })]
+
+
+class AuxDropoutDetector(IntervalDetector):
+    """
+    Aux channel (0 based) missing from the packet or reading at or below floor (raw)
+    """
+    kind = 'aux-dropout'
+
+    def __init__(self, channel, floor=0, min_packets=2):
+        super(AuxDropoutDetector, self).__init__(min_packets=min_packets)
+        self.channel = channel
+        self.floor = floor
+
+    def active(self, packet):
+        channels = packet.aux_channels()
+        return len(channels) <= self.channel or channels[self.channel].aux() <= self.floor
+
+    def detail(self):
+        return {'channel': self.channel}
+
+
+class EventEngine(object):
+    """
+    Runs all registered detectors together in one pass
+    """
+
+    def __init__(self, detectors=()):
+        super(EventEngine, self).__init__()
+        self.detectors = list(detectors)
+        self.packets = 0
+        self._time = 0.0
+
+    def register(self, detector):
+        self.detectors.append(detector)
+        return detector
+
+    def feed(self, packet, time=None, packet_number=None):
+        """
+        :param time: ms since the first packet; packet number * PACKET_INTERVAL when not known
+        :param packet_number: when packets may have been skipped (e.g. a live sink dropped some)
+        :rtype: list of Event
+        """
+        if packet_number is not None:
+            self.packets = packet_number
+        if time is None:
+            time = self.packets * PACKET_INTERVAL
+        events = []
+        for detector in self.detectors:
+            found = detector.feed(self.packets, time, packet)
+            if found:
+                events.extend(found)
+        self.packets += 1
+        self._time = time
+        return events
+
+    def finish(self):
+        events = []
+        end = self._time + PACKET_INTERVAL if self.packets else 0.0
+        for detector in self.detectors:
+            found = detector.finish(self.packets, end)
+            if found:
+                events.extend(found)
+        return events
+
+    def run(self, packets):
+        """
+        :type packets: iterable of MTS.Packet.Packet
+        :return: events as they complete
+        """
+        for packet in packets:
+            for event in self.feed(packet):
+                yield event
+        for event in self.finish():
+            yield event
+
+
+def default_detectors(aux_channels=()):
+    detectors = [WarmupDetector(), FunctionTransitionDetector(), AfrExcursionDetector()]
+    detectors.extend(AuxDropoutDetector(channel) for channel in aux_channels)
+    return detectors
+
+
+def detect_file(path, detectors=None):
+    """
+    Batch run over one capture; event times come from its receive stamps when it has them
+    :return: generator of Event
+    """
+    engine = EventEngine(detectors if detectors is not None else default_detectors())
+    with captured_stream(path) as instream:
+        for frame, time in zip(read_frames(instream), packet_clock(capture_stamps(path))):
+            for event in engine.feed(decode_frame(frame), time=time):
+                yield event
+    for event in engine.finish():
+        yield event
+
+
+class EventSink(Sink):
+    """
+    Run an EventEngine incrementally alongside a live capture; callback(event) per event
+    """
+
+    def __init__(self, engine, callback, name='events', **kwargs):
+        super(EventSink, self).__init__(name, **kwargs)
+        self.engine = engine
+        self._callback = callback
+        self._first = None
+
+    def handle(self, index, received, frame):
+        if self._first is None:
+            self._first = received
+        time = (received - self._first) / 1e6
+        for event in self.engine.feed(decode_frame(frame), time=time, packet_number=index):
+            self._callback(event)
+
+    def close(self):
+        for event in self.engine.finish():
+            self._callback(event)
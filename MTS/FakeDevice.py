@@ -0,0 +1,141 @@
+"""
+A stand-in for an MTS chain on a serial port, answering commands from the exchanges
+captured in cap/.
+
+It streams data frames at packet rate and answers what is written to it the way the
+captures show the real chain doing:
+
+  in-band commands     a command response frame, slotted in between two data frames;
+                       NAMELIST answers with the name in cap/0x6E.txt, TYPELIST with the
+                       type record in cap/S.txt, LISTEN and UNLISTEN with no data
+  out-of-band 'S', 'n'
+                       packet generation stops and the captured bytes are sent raw
+  CALIBRATE ('c')      written and done; the stream carries on with no answer
+
+cap/0x63.txt is not the chain's answer to 'c': it holds the host side of an LM Programmer
+session (the 'S', 'c', 'n' probes it sends, LMProgrammer-set-input1.txt less its final CR),
+so it is not played back.
+
+    device = FakeDevice.from_cap('cap', frames=frames_from_file('Serial-log.isp2', repeat=True))
+    channel = CommandChannel(device, sinks=[...])
+"""
+from __future__ import print_function, division
+import collections
+import io
+import os
+import threading
+import time
+
+from MTS.Command import LISTEN, NAMELIST, TYPELIST, UNLISTEN, response_frame
+from MTS.Packet import PACKET_INTERVAL
+
+# Out-of-band command character: capture file holding the chain's answer
+CAPTURES = {
+    b'S': 'S.txt',
+    b'n': '0x6E.txt',
+}
+
+
+def _read_capture(directory, name):
+    with io.open(os.path.join(directory, name), mode='rb') as instream:
+        return instream.read()
+
+
+class FakeDevice(object):
+    """
+    Serial port lookalike: read() blocks for at most timeout seconds like pyserial, and
+    in_waiting counts the bytes ready.
+
+    :param frames: iterable of raw data frames to stream; the stream goes quiet at its end
+    :param responses: {command: response data} for in-band commands
+    :param out_of_band: {command character: raw answer} for out-of-band commands
+    :param interval: ms between data frames
+    """
+
+    def __init__(self, frames=(), responses=None, out_of_band=None, interval=PACKET_INTERVAL, timeout=0.1):
+        super(FakeDevice, self).__init__()
+        self._frames = iter(frames)
+        self.responses = dict(responses or {})
+        self.out_of_band = dict(out_of_band or {})
+        self._interval = interval / 1000.0
+        self.timeout = timeout
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+        self._lock = threading.Condition()
+        self._next_frame = time.time()
+        self.streaming = True
+        self.written = []
+        self.closed = False
+
+    @classmethod
+    def from_cap(cls, directory='cap', **kwargs):
+        responses = {
+            ord(NAMELIST): _read_capture(directory, CAPTURES[b'n']),
+            ord(TYPELIST): _read_capture(directory, CAPTURES[b'S']),
+            ord(LISTEN): b'',
+            ord(UNLISTEN): b'',
+        }
+        out_of_band = dict((command, _read_capture(directory, name)) for command, name in CAPTURES.items())
+        return cls(responses=responses, out_of_band=out_of_band, **kwargs)
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._fill()
+            return len(self._buffer)
+
+    def _fill(self):
+        # Whole frames only, so a response never lands in the middle of a data frame
+        if self._buffer:
+            return
+        if self._pending:
+            self._buffer.extend(self._pending.popleft())
+            return
+        if self.streaming and time.time() >= self._next_frame:
+            frame = next(self._frames, None)
+            if frame is None:
+                self.streaming = False
+                return
+            self._buffer.extend(frame)
+            self._next_frame += self._interval
+
+    def read(self, size=1):
+        deadline = time.time() + self.timeout
+        with self._lock:
+            while 1:
+                self._fill()
+                if self._buffer or self.closed:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                wait = remaining
+                if self.streaming:
+                    wait = min(wait, max(self._next_frame - time.time(), 0.001))
+                self._lock.wait(wait)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def write(self, data):
+        data = bytes(data)
+        if not data:
+            return 0
+        with self._lock:
+            self.written.append(data)
+            command = data[0:1]
+            if command in self.out_of_band:
+                self.streaming = False
+                self._pending.append(self.out_of_band[command])
+            elif ord(command) in self.responses:
+                self._pending.append(response_frame(ord(command), self.responses[ord(command)]))
+            self._lock.notify_all()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._lock.notify_all()
@@ -0,0 +1,131 @@
+from __future__ import print_function, division
+import array
+import io
+import os
+import struct
+import sys
+
+from MTS.stream import FrameParser, frame_length
+
+
+def _offsets_array(values=()):
+    # 'I' is 32 bits everywhere we run; captures are far below 4 GiB
+    return array.array('I', values)
+
+
+class FrameIndex(object):
+    """
+    Byte offset of every frame in a capture file, so any packet can be read without scanning.
+
+    The index command saves it next to the capture as <capture>.idx; other readers use a
+    sidecar when one exists and otherwise keep the index in memory. A sidecar is only
+    trusted while the capture's size and modification time still match.
+
+    partial is the offset of a frame that starts in this file but is cut off by its end
+    (OpenLog splits a drive into files mid frame), or None.
+    """
+
+    SUFFIX = '.idx'
+    MAGIC = b'ISP2IDX3'
+    _HEADER = struct.Struct('<8sQdIq')
+
+    def __init__(self, offsets=None, size=0, mtime=0.0, partial=None):
+        super(FrameIndex, self).__init__()
+        self.offsets = offsets if offsets is not None else _offsets_array()
+        self.size = size
+        self.mtime = mtime
+        self.partial = partial
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def offset(self, packet_number):
+        return self.offsets[packet_number]
+
+    def read_frame(self, instream, packet_number):
+        """
+        Seek to and read one raw frame
+        :rtype: bytes
+        """
+        instream.seek(self.offsets[packet_number])
+        head = instream.read(2)
+        if len(head) != 2:
+            raise BufferError("Reached end of stream")
+        word = (bytearray(head)[0] << 8) | bytearray(head)[1]
+        return head + instream.read(frame_length(word) - 2)
+
+    @classmethod
+    def build(cls, instream, chunk_size=io.DEFAULT_BUFFER_SIZE):
+        """
+        Scan a whole stream, recording where each frame starts
+        :rtype: FrameIndex
+        """
+        offsets = _offsets_array()
+        parser = FrameParser(offsets=offsets)
+        size = 0
+        while 1:
+            chunk = instream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            parser.feed(chunk)
+        return cls(offsets, size=size, partial=parser.partial_offset())
+
+    @classmethod
+    def sidecar_path(cls, path):
+        return path + cls.SUFFIX
+
+    @classmethod
+    def for_file(cls, path, save=False):
+        """
+        Load the sidecar index for path, (re)building it when missing or stale
+        :param save: write the (re)built index to the sidecar
+        :rtype: FrameIndex
+        """
+        stat = os.stat(path)
+        try:
+            index = cls.load(cls.sidecar_path(path))
+            if index.size == stat.st_size and index.mtime == stat.st_mtime:
+                return index
+        except (IOError, OSError, ValueError):
+            pass
+        with io.open(path, mode='rb') as instream:
+            index = cls.build(instream)
+        index.mtime = stat.st_mtime
+        if save:
+            try:
+                index.save(cls.sidecar_path(path))
+            except (IOError, OSError) as e:
+                print("Failed to save index: {}".format(e), file=sys.stderr)
+        return index
+
+    def save(self, path):
+        offsets = _offsets_array(self.offsets)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        with io.open(path, mode='wb') as out:
+            out.write(self._HEADER.pack(
+                self.MAGIC, self.size, self.mtime, len(offsets), -1 if self.partial is None else self.partial
+            ))
+            out.write(offsets.tostring() if sys.version_info[0] < 3 else offsets.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with io.open(path, mode='rb') as instream:
+            head = instream.read(cls._HEADER.size)
+            if len(head) != cls._HEADER.size:
+                raise ValueError('Truncated index {}'.format(path))
+            magic, size, mtime, count, partial = cls._HEADER.unpack(head)
+            if magic != cls.MAGIC:
+                raise ValueError('Not a frame index {}'.format(path))
+            offsets = _offsets_array()
+            body = instream.read()
+            if sys.version_info[0] < 3:
+                offsets.fromstring(body)
+            else:
+                offsets.frombytes(body)
+        if len(offsets) != count:
+            raise ValueError('Truncated index {}'.format(path))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        return cls(offsets, size=size, mtime=mtime, partial=None if partial < 0 else partial)
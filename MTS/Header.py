@@ -32,7 +32,7 @@ class Header(ctypes.Union):
 
     def read_packet(self, in_stream, debug_stream=None):
         # Read the bytes that are required to complete the packet
-        wordslen = (self.word & 0x1000 << 7) | self.word & 0x007F
+        wordslen = self.word_count()
         byteslen = wordslen * 2
         if debug_stream:
             print(
@@ -43,7 +43,9 @@ class Header(ctypes.Union):
         if debug_stream:
             print(' '.join(['{:02X}'.format(b) for b in bodybytes]), file=debug_stream)
 
-        in_stream.readinto(bodybytes)
+        if (in_stream.readinto(bodybytes) or 0) < byteslen:
+            # Stream ended mid packet; FrameParser drops that partial frame too
+            raise BufferError("Reached end of stream")
 
         # Take pairs of body bytes for to return words of data
         body = [(bodybytes[idx] << 8) | bodybytes[idx + 1] for idx in range(0, byteslen-1, 2)]
@@ -3,7 +3,7 @@ from __future__ import division
 import ctypes
 
 import MTS
-import Header
+import MTS.Header
 
 PACKET_INTERVAL = 81.92  # 8000000 / 655360
 
@@ -11,7 +11,7 @@ PACKET_INTERVAL = 81.92  # 8000000 / 655360
 def packet_tostring(packet):
     # chunks = ["Size={:02d}".format(len(packet))]
     # Header word
-    header = Header.Header()
+    header = MTS.Header.Header()
     header.word = packet[0]
     chunks = [header.desc()]
 
@@ -30,6 +30,10 @@ def packet_tostring(packet):
             bbits.word = packet[3]
             auxstart += 1
 
+    # LM-1 Function&Lambda&Battery; the battery word is always sent
+    elif len(packet) > 3 and packet[1] & MTS.FUNCTION_LM_MASK == MTS.FUNCTION_LM:
+        auxstart += 3
+
     # Channels
     if len(packet) >= auxstart:
         for channel, auxword in enumerate(packet[auxstart:]):
@@ -40,6 +44,14 @@ def packet_tostring(packet):
     return '; '.join(chunks)
 
 
+def format_packet(i, packet):
+    return "{: 5d} 0x{} {}".format(
+        i,
+        '-'.join(['{:04X}'.format(word) for word in packet.words()]),
+        packet.data_line()
+    )
+
+
 class Packet(object):
     def __init__(self, header, body):
         """
@@ -52,6 +64,7 @@ class Packet(object):
         self._header = header
         self._subpackets = []
         self._has_lambda = False
+        self._lm1 = False
         self._auxstart = 0
 
         # Optional Function&Lambda&Battery
@@ -67,42 +80,54 @@ class Packet(object):
             if len(body) > 2 and body[2] & 0x3800 != 0:
                 bbits = SubPacket()
                 bbits.word = body[2]
+                self._subpackets.append(bbits)
                 self._auxstart += 1
 
-        elif body[0] & MTS.FUNCTION_LM_MASK == MTS.FUNCTION_LM_MASK:
-            raise ValueError('LM-1 Not implemented.')
+        # LM-1: function and lambda words laid out as the LC-1's, then a battery word
+        elif len(body) > 1 and body[0] & MTS.FUNCTION_LM_MASK == MTS.FUNCTION_LM:
+            self._has_lambda = True
+            self._lm1 = True
+            fbits = SubPacket()
+            fbits.word = body[0]
+            self._subpackets.append(fbits)
+            lbits = SubPacket()
+            lbits.word = body[1]
+            self._subpackets.append(lbits)
+            self._auxstart += 2
+            if len(body) > 2:
+                bbits = SubPacket()
+                bbits.word = body[2]
+                self._subpackets.append(bbits)
+                self._auxstart += 1
 
-        # Channels
-        if len(body) > self._auxstart:
-            for channel, auxword in enumerate(body[self._auxstart:]):
-                abits = SubPacket()
-                abits.word = auxword
-                self._subpackets.append(abits)
-        else:
-            self._auxstart = 0
+        # Channels; every word so far has a sub-packet, so aux channels start at _auxstart in both
+        for auxword in body[self._auxstart:]:
+            abits = SubPacket()
+            abits.word = auxword
+            self._subpackets.append(abits)
 
     def data_line(self):
         result = ""
         if self._has_lambda:
             f = getattr(self._subpackets[0], 'function')
             lambda_packet = getattr(self._subpackets[1], 'lambda')
-            if f.function() is 'Warmup':
+            if f.function() == 'Warmup':
                 result += "W      {: 4d}%".format(lambda_packet.lambda_value())
             else:
                 result += f.function()[0]
                 try:
                     result += " AFR={:5.3f}".format(self.air_fuel_ratio())
                 except ValueError as afr_error:
-                    result += " {}".format(afr_error.message)
+                    result += " {}".format(afr_error)
         else:
             return "<NO LAMBDA>"
 
-        if self._auxstart > 0:
-            ssi4 = [p.aux for p in self._subpackets[self._auxstart:]]
-            result += " {:05d} rpm".format(ssi4[0].rpm())
-            result += " {:05d} raw".format(ssi4[1].aux())
-            result += " {:05d} raw".format(ssi4[2].aux())
-            result += " {:05d} raw".format(ssi4[3].aux())
+        # SSI-4 channel 1 carries rpm; show only the channels the chain sent
+        for channel, a in enumerate(self.aux_channels()):
+            if channel == 0:
+                result += " {:05d} rpm".format(a.rpm())
+            else:
+                result += " {:05d} raw".format(a.aux())
         return result
 
     def __str__(self):
@@ -111,18 +136,17 @@ class Packet(object):
         if self._has_lambda:
             f = getattr(self._subpackets[0], 'function')
             lambda_packet = getattr(self._subpackets[1], 'lambda')
-            if f.function() is 'Warmup':
+            if f.function() == 'Warmup':
                 result += " Warmup {} % of operating temp".format(lambda_packet.lambda_value())
             else:
                 result += " {}={} {}".format(f.function(), f.air_fuel_value(), f.air_fuel_units())
                 try:
                     result += " AFR={:4.3f}".format(self.air_fuel_ratio())
                 except ValueError as afr_error:
-                    result += " {}".format(afr_error.message)
+                    result += " {}".format(afr_error)
 
-        if self._auxstart > 0:
-            for channel, a in enumerate([p.aux for p in self._subpackets[self._auxstart:]]):
-                result += " ch{:02d}={:4.3f}V".format(channel, a.volts())
+        for channel, a in enumerate(self.aux_channels()):
+            result += " ch{:02d}={:4.3f}V".format(channel, a.volts())
         return result
 
     def add_word(self, word):
@@ -144,6 +168,43 @@ class Packet(object):
         """
         return [self._header.word] + [p.word for p in self._subpackets]
 
+    def is_lm1(self):
+        """
+        :return: True when the lambda sub-packet came from an LM-1 rather than an LC-1
+        """
+        return self._lm1
+
+    def function(self):
+        """
+        :return: function name, or None when the packet has no lambda sub-packet
+        """
+        if self._has_lambda:
+            return self._subpackets[0].function.function()
+        return None
+
+    def lambda_value(self):
+        if self._has_lambda:
+            return getattr(self._subpackets[1], 'lambda').lambda_value()
+        return None
+
+    def aux_channels(self):
+        """
+        :rtype: list of AuxBits
+        """
+        return [p.aux for p in self._subpackets[self._auxstart:]]
+
+    def aux_values(self, calibrations):
+        """
+        Every aux channel in engineering units; volts where a channel has no calibration
+        :type calibrations: MTS.Calibration.Calibrations
+        :rtype: list of float
+        """
+        values = []
+        for channel, a in enumerate(self.aux_channels()):
+            calibration = calibrations.get(channel)
+            values.append(calibration.table[a.aux()] if calibration is not None else a.volts())
+        return values
+
     def air_fuel_ratio(self):
         # Air/Fuel Ratio = ((L12..L0) + 500)* (AF7..0) / 10000
         if self._has_lambda:
@@ -151,11 +212,11 @@ class Packet(object):
             f = self._subpackets[0].function
             # Must be in 'Normal' function
             l = getattr(self._subpackets[1], 'lambda')
-            if 'Normal' is f.function():
+            if f.function() == 'Normal':
                 return (l.lambda_value() + 500) * f.air_fuel_value() / 10000
-            elif 'O2' is f.function():
+            elif f.function() == 'O2':
                 return l.lambda_value() / 10.0
-            elif 'Warmup' is f.function():
+            elif f.function() == 'Warmup':
                 return l.lambda_value() / 10.0
             else:
                 raise ValueError('NA: {}'.format(f.function()))
@@ -196,13 +257,13 @@ class FunctionBits(ctypes.BigEndianStructure):
 
     def air_fuel_units(self):
         f = self.function()
-        if f is 'Normal':
+        if f == 'Normal':
             return 'ratio'
-        if f is 'Warmup':
+        if f == 'Warmup':
             return '% temp'
-        if f is '02 Tenths':
+        if f == '02 Tenths':
             return '%'
-        if f is 'Calibrating Heat':
+        if f == 'Calibrating Heat':
             return 'count'
         # TODO: other function units
         return ''
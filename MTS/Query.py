@@ -0,0 +1,316 @@
+"""
+Filter expressions over decoded session columns, evaluated a whole column at a time.
+
+    afr > 14.7 and aux1.rpm > 3000 and function == 'Normal'
+
+Names:
+    packet, time (ms), function, lambda_value, multiplier, afr
+    auxN (raw), auxN.raw, auxN.volts, auxN.percent, auxN.rpm   N counts from 1
+    auxN.cal, or the channel's calibration name (see MTS.Calibration)
+Operators: comparisons (chains allowed), and, or, not, + - * / and unary minus.
+A value is false where it is 0 or missing (NaN); == None and != None test for missing.
+Dividing by zero gives a missing value.
+"""
+from __future__ import print_function, division
+import array
+import ast
+import itertools
+import operator
+import re
+
+from MTS.Columns import NO_FUNCTION, NO_AUX, FUNCTION_CODES
+from MTS.Packet import AuxBits
+from MTS.Timing import packet_times
+
+_COMPARE = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+
+def _divide(a, b):
+    # Raw aux values are often 0; those packets just have no value
+    return a / b if b else float('nan')
+
+
+_ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: _divide,
+}
+
+
+# Built in names; calibrations may not take them (see MTS.Calibration)
+NAMES = frozenset(('packet', 'time', 'function', 'lambda_value', 'multiplier', 'afr'))
+
+# Python 2 parses these as names
+_NAMED_CONSTANTS = {'None': None, 'True': True, 'False': False}
+
+_NO_CONSTANT = object()
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _is_column(value):
+    return isinstance(value, (list, array.array))
+
+
+def _apply(op, left, right, length):
+    """
+    Element-wise op over any mix of columns and scalars
+    """
+    try:
+        if _is_column(left):
+            if _is_column(right):
+                return list(map(op, left, right))
+            return list(map(op, left, itertools.repeat(right, length)))
+        if _is_column(right):
+            return list(map(op, itertools.repeat(left, length), right))
+        return op(left, right)
+    except (TypeError, ValueError) as e:
+        raise QueryError('Bad operands: {}'.format(e))
+
+
+def _truth(value):
+    # NaN marks a missing value; it is false, as every comparison with it is
+    return value == value and bool(value)
+
+
+def _broadcast(value, length):
+    """
+    :return: one bool per packet
+    """
+    if _is_column(value):
+        return list(map(_truth, value))
+    return [_truth(value)] * length
+
+
+def _missing(value):
+    return value is None or value != value
+
+
+class Query(object):
+
+    def __init__(self, expression, calibrations=None):
+        """
+        :type calibrations: MTS.Calibration.Calibrations
+        """
+        super(Query, self).__init__()
+        self.expression = expression
+        self.calibrations = calibrations
+        try:
+            self._tree = ast.parse(expression.strip(), mode='eval').body
+        except SyntaxError as e:
+            hint = '; the lambda column is lambda_value' if re.search(r'\blambda\b', expression) else ''
+            raise QueryError('Bad query {!r}: {}{}'.format(expression, e, hint))
+
+    def mask(self, columns):
+        """
+        :type columns: MTS.Columns.Columns
+        :return: one bool per packet
+        :rtype: list
+        """
+        self._columns = columns
+        self._length = len(columns)
+        self._resolved = {}
+        try:
+            return _broadcast(self._eval(self._tree), self._length)
+        finally:
+            self._columns = None
+            self._resolved = None
+
+    def ranges(self, columns):
+        """
+        :return: (first, stop) packet ranges where the query holds; stop is exclusive
+        """
+        return mask_ranges(self.mask(columns))
+
+    # Evaluation
+
+    def _eval(self, node):
+        if isinstance(node, ast.BoolOp):
+            values = [_broadcast(self._eval(v), self._length) for v in node.values]
+            combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+            result = values[0]
+            for value in values[1:]:
+                result = list(map(combine, result, value))
+            return result
+        if isinstance(node, ast.UnaryOp):
+            operand = self._eval(node.operand)
+            if isinstance(node.op, ast.Not):
+                if _is_column(operand):
+                    return [not v for v in _broadcast(operand, self._length)]
+                return not _truth(operand)
+            if isinstance(node.op, ast.USub):
+                # 0 - x, so a non-number fails like any other operand
+                return _apply(operator.sub, 0, operand, self._length)
+        if isinstance(node, ast.Compare):
+            return self._compare(node)
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            return _apply(_ARITHMETIC[type(node.op)], self._eval(node.left), self._eval(node.right), self._length)
+        if isinstance(node, ast.Name) and node.id in _NAMED_CONSTANTS:
+            return _NAMED_CONSTANTS[node.id]
+        if isinstance(node, (ast.Name, ast.Attribute)):
+            return self._column(node)
+        constant = _constant(node)
+        if constant is not _NO_CONSTANT:
+            return constant
+        raise QueryError('Unsupported expression: {}'.format(ast.dump(node)))
+
+    def _compare(self, node):
+        result = None
+        left_node = node.left
+        left = self._eval(left_node)
+        for op, right_node in zip(node.ops, node.comparators):
+            if type(op) not in _COMPARE:
+                raise QueryError('Unsupported comparison in {!r}'.format(self.expression))
+            right = self._eval(right_node)
+            a, b = self._function_operands(left_node, left, right_node, right)
+            if a is None or b is None:
+                step = self._compare_none(op, b if a is None else a)
+            else:
+                step = _apply(_COMPARE[type(op)], a, b, self._length)
+            result = step if result is None else _apply(operator.and_, result, step, self._length)
+            left_node, left = right_node, right
+        return result
+
+    def _compare_none(self, op, value):
+        if not isinstance(op, (ast.Eq, ast.NotEq)):
+            raise QueryError('None only compares with == or != in {!r}'.format(self.expression))
+        missing = list(map(_missing, value)) if _is_column(value) else _missing(value)
+        if isinstance(op, ast.Eq):
+            return missing
+        return [not m for m in missing] if _is_column(missing) else not missing
+
+    def _function_operands(self, left_node, left, right_node, right):
+        # function == 'Normal': compare codes instead of names
+        if _name(left_node) == 'function' and not _is_column(right):
+            return left, _function_code(right)
+        if _name(right_node) == 'function' and not _is_column(left):
+            return _function_code(left), right
+        return left, right
+
+    def _column(self, node):
+        name = _name(node)
+        if name is None:
+            raise QueryError('Unsupported name: {}'.format(ast.dump(node)))
+        if name not in self._resolved:
+            self._resolved[name] = self._resolve(name)
+        return self._resolved[name]
+
+    def _resolve(self, name):
+        columns = self._columns
+        if name == 'packet':
+            return list(range(self._length))
+        if name == 'time':
+            return columns.time()
+        if name == 'function':
+            return columns.function
+        if name == 'lambda_value':
+            return columns.lambda_value
+        if name == 'multiplier':
+            return columns.multiplier
+        if name == 'afr':
+            return columns.afr()
+        if name.startswith('aux'):
+            channel, _, unit = name[3:].partition('.')
+            try:
+                channel = int(channel) - 1
+            except ValueError:
+                raise QueryError('Unknown name: {}'.format(name))
+            if not 0 <= channel < columns.channels():
+                # No such channel in this session; nothing can match
+                return [float('nan')] * self._length
+            if unit in ('', 'raw'):
+                return [v if v != NO_AUX else float('nan') for v in columns.raw(channel)]
+            if unit == 'volts':
+                return columns.volts(channel)
+            if unit == 'percent':
+                return [v / AuxBits.MAX_VALUE if v != NO_AUX else float('nan') for v in columns.raw(channel)]
+            if unit == 'rpm':
+                return [v * AuxBits.RPM_FACTOR if v != NO_AUX else float('nan') for v in columns.raw(channel)]
+            if unit == 'cal':
+                calibration = self.calibrations.get(channel) if self.calibrations is not None else None
+                if calibration is None:
+                    raise QueryError('No calibration for {}'.format(name))
+                return columns.calibrated(channel, calibration)
+        named = self.calibrations.by_name(name) if self.calibrations is not None else None
+        if named is not None:
+            channel, calibration = named
+            if channel >= columns.channels():
+                return [float('nan')] * self._length
+            return columns.calibrated(channel, calibration)
+        raise QueryError('Unknown name: {}'.format(name))
+
+
+def _name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+        return '{}.{}'.format(node.value.id, node.attr)
+    return None
+
+
+def _constant(node):
+    """
+    :return: the literal's value, or _NO_CONSTANT when node is not a literal
+    """
+    if hasattr(ast, 'Constant') and isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, getattr(ast, 'NameConstant', ())):
+        return node.value
+    if isinstance(node, getattr(ast, 'Num', ())):
+        return node.n
+    if isinstance(node, getattr(ast, 'Str', ())):
+        return node.s
+    return _NO_CONSTANT
+
+
+def _function_code(name):
+    if name in FUNCTION_CODES:
+        return FUNCTION_CODES[name]
+    if name is None:
+        return NO_FUNCTION
+    raise QueryError('Unknown function {!r}; one of {}'.format(name, ', '.join(sorted(FUNCTION_CODES))))
+
+
+def mask_ranges(mask):
+    """
+    :return: (first, stop) runs of True; stop is exclusive
+    """
+    ranges = []
+    start = None
+    for n, hit in enumerate(mask):
+        if hit:
+            if start is None:
+                start = n
+        elif start is not None:
+            ranges.append((start, n))
+            start = None
+    if start is not None:
+        ranges.append((start, len(mask)))
+    return ranges
+
+
+def search(paths, expression, cache=None, calibrations=None):
+    """
+    Run one query over many captures, using the decode cache
+    :return: (path, first, stop, first time, stop time) for every matching range; times in
+        ms as the time column has them, the stop time being where packet stop starts
+    """
+    from MTS.Cache import load_session
+    query = Query(expression, calibrations=calibrations)
+    for path in paths:
+        columns = load_session(path, cache=cache)
+        times = None
+        for first, stop in query.ranges(columns):
+            if times is None:
+                times = packet_times(len(columns) + 1, columns.received)
+            yield path, first, stop, times[first], times[stop]
@@ -0,0 +1,251 @@
+"""
+Serve a capture as a live, timed ISP2 byte stream to any number of network clients.
+
+One thread runs a select() loop: at each tick the next frame is queued, unchanged, for
+every connected client, and sockets are only written when they are ready, so no client
+can delay the tick. Ticks fall on fixed deadlines (start + n * interval) rather than
+sleeping an interval after each send, so the stream does not drift however many clients
+there are. A client that lets more than max_buffer bytes pile up is disconnected.
+
+    nc localhost 8192 > received.ISP2
+"""
+from __future__ import print_function, division
+import errno
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+from MTS.Packet import PACKET_INTERVAL
+from MTS.stream import captured_stream, read_frames
+
+_log = logging.getLogger('replay-server')
+
+_clock = getattr(time, 'monotonic', time.time)
+
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+class _Client(object):
+
+    def __init__(self, sock, name):
+        super(_Client, self).__init__()
+        self.sock = sock
+        self.name = name
+        self.buffer = bytearray()
+        self.sent = 0
+
+
+class ReplayServer(object):
+    """
+    :param frames: iterable of raw ISP2 frames, e.g. frames_from_file(path)
+    :param address: (host, port) to listen on for TCP, or None; port 0 picks a free port
+    :param unix_path: also listen on this Unix socket path
+    :param interval: ms between frames
+    :param max_buffer: bytes a client may have waiting before it is disconnected
+    """
+
+    def __init__(self, frames, address=('127.0.0.1', 8192), unix_path=None, interval=PACKET_INTERVAL,
+                 max_buffer=16 * 1024):
+        super(ReplayServer, self).__init__()
+        if address is None and unix_path is None:
+            raise ValueError('Nothing to listen on')
+        self._frames = iter(frames)
+        self._interval = interval / 1000.0
+        self.max_buffer = max_buffer
+        self.unix_path = unix_path
+        self._listeners = []
+        self._clients = {}
+        self._running = False
+        self._thread = None
+        self.address = None
+        self.frames = 0
+        self.accepted = 0
+        self.disconnected = 0
+        self.dropped_slow = 0
+        # Worst lateness of a tick behind its deadline, in seconds
+        self.max_late = 0.0
+
+        if address is not None:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(address)
+            self.address = listener.getsockname()
+            self._listen(listener)
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(unix_path)
+            self._listen(listener)
+
+    def _listen(self, listener):
+        listener.listen(16)
+        listener.setblocking(False)
+        self._listeners.append(listener)
+
+    def clients(self):
+        return len(self._clients)
+
+    def start(self):
+        """
+        Serve on a background thread; returns immediately
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name='replay-server')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def serve_forever(self):
+        """
+        Serve on the calling thread until the frames run out or stop() is called
+        """
+        self._running = True
+        self._serve()
+
+    def stop(self, timeout=None):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _serve(self):
+        try:
+            start = _clock()
+            tick = 0
+            while self._running:
+                now = _clock()
+                deadline = start + tick * self._interval
+                if now >= deadline:
+                    self.max_late = max(self.max_late, now - deadline)
+                    if not self._tick():
+                        break
+                    tick += 1
+                    # Behind by more than a tick (e.g. the process was suspended): skip ahead, don't burst
+                    if now - deadline > self._interval:
+                        start = now - (tick - 1) * self._interval
+                    continue
+                self._poll(deadline - now)
+            self._drain()
+        finally:
+            self._close()
+
+    def _tick(self):
+        try:
+            frame = next(self._frames)
+        except StopIteration:
+            return False
+        self.frames += 1
+        for client in list(self._clients.values()):
+            if len(client.buffer) + len(frame) > self.max_buffer:
+                _log.warning('Disconnecting %s: %d bytes behind', client.name, len(client.buffer))
+                self.dropped_slow += 1
+                self._drop(client)
+                continue
+            client.buffer.extend(frame)
+            self._send(client)
+        return True
+
+    def _poll(self, timeout):
+        readers = list(self._listeners) + list(self._clients)
+        writers = [sock for sock, client in self._clients.items() if client.buffer]
+        try:
+            readable, writable, _ = select.select(readers, writers, [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        for sock in readable:
+            if sock in self._listeners:
+                self._accept(sock)
+            elif sock in self._clients:
+                self._receive(self._clients[sock])
+        for sock in writable:
+            if sock in self._clients:
+                self._send(self._clients[sock])
+
+    def _accept(self, listener):
+        try:
+            sock, peer = listener.accept()
+        except socket.error as e:
+            if e.args[0] in _WOULD_BLOCK:
+                return
+            raise
+        sock.setblocking(False)
+        if sock.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        name = '{}:{}'.format(*peer) if isinstance(peer, tuple) else (peer or self.unix_path)
+        self._clients[sock] = _Client(sock, name)
+        self.accepted += 1
+        _log.info('Client %s connected', name)
+
+    def _receive(self, client):
+        # Clients have nothing to say; read only to notice them hanging up
+        try:
+            data = client.sock.recv(4096)
+        except socket.error as e:
+            if e.args[0] in _WOULD_BLOCK:
+                return
+            data = b''
+        if not data:
+            self._drop(client)
+
+    def _send(self, client):
+        try:
+            sent = client.sock.send(client.buffer)
+        except socket.error as e:
+            if e.args[0] in _WOULD_BLOCK:
+                return
+            self._drop(client)
+            return
+        del client.buffer[:sent]
+        client.sent += sent
+
+    def _drop(self, client):
+        self._clients.pop(client.sock, None)
+        self.disconnected += 1
+        try:
+            client.sock.close()
+        except socket.error:
+            pass
+        _log.info('Client %s disconnected after %d bytes', client.name, client.sent)
+
+    def _drain(self, timeout=1.0):
+        """
+        Give clients a moment to take the tail of the stream after the last frame
+        """
+        deadline = _clock() + timeout
+        while self._running and any(c.buffer for c in self._clients.values()) and _clock() < deadline:
+            self._poll(deadline - _clock())
+
+    def _close(self):
+        for client in list(self._clients.values()):
+            self._drop(client)
+        for listener in self._listeners:
+            listener.close()
+        self._listeners = []
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+
+def frames_from_file(path, repeat=False):
+    """
+    Raw frames of a capture (or list of captures), read once into memory so every pass
+    and every client gets the same bytes
+    :rtype: generator of bytes
+    """
+    with captured_stream(path) as instream:
+        frames = list(read_frames(instream))
+    if not frames:
+        return
+    while 1:
+        for frame in frames:
+            yield frame
+        if not repeat:
+            return
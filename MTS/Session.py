@@ -0,0 +1,196 @@
+"""
+Several capture files presented as one continuous session.
+
+OpenLog splits a drive into openlog-YYYYMMDD-001.TXT, -002.TXT, ... at arbitrary byte
+boundaries, so a frame can start in one file and finish in the next. The files are read
+as one byte stream; a split frame belongs to the file it starts in.
+"""
+from __future__ import print_function, division
+import io
+
+from MTS.BlockStore import BlockReader, BlockStream, is_block_file
+from MTS.FrameIndex import FrameIndex
+from MTS.stream import HEADER_LOW_MASK, captured_stream, decode_frame, read_frames
+from MTS.Timing import PacketClock, capture_stamps
+
+
+class ChainedStream(io.RawIOBase):
+    """
+    Read a list of captures back to back as one stream, opening each only when reached
+    """
+
+    def __init__(self, paths, first=None):
+        """
+        :param first: already positioned stream for paths[0], e.g. after a seek
+        """
+        super(ChainedStream, self).__init__()
+        self._paths = list(paths)
+        self._current = first
+        self._next = 0 if first is None else 1
+        self.opened = []
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while 1:
+            if self._current is None:
+                if self._next >= len(self._paths):
+                    return 0
+                self._current = captured_stream(self._paths[self._next])
+                self.opened.append(self._paths[self._next])
+                self._next += 1
+            data = self._current.read(len(b))
+            if data:
+                b[:len(data)] = data
+                return len(data)
+            self._current.close()
+            self._current = None
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        super(ChainedStream, self).close()
+
+
+class Session(object):
+    """
+    An ordered set of capture files with global packet numbering.
+
+    Packet counts come from each file's frame index (see FrameIndex), so finding
+    the file that holds a packet reads indexes, and only that capture is opened.
+    Packet times come from the capture's receive stamps when a single capture has them.
+    """
+
+    def __init__(self, paths):
+        super(Session, self).__init__()
+        self.paths = list(paths)
+        self._indexes = [None] * len(self.paths)
+        # Global packet number of the first packet of each file, as far as known
+        self._firsts = [0]
+        self._clock = None
+
+    @classmethod
+    def from_pattern(cls, pattern):
+        """
+        e.g. Session.from_pattern('data/openlog-20160807-*.TXT'); files in name order
+        """
+        import glob
+        return cls(sorted(glob.glob(pattern)))
+
+    def _index(self, n):
+        """
+        :return: FrameIndex or BlockReader for file n
+        """
+        if self._indexes[n] is None:
+            path = self.paths[n]
+            with io.open(path, mode='rb') as instream:
+                block = is_block_file(instream.read(8))
+            self._indexes[n] = BlockReader.open(path) if block else FrameIndex.for_file(path)
+        return self._indexes[n]
+
+    def file_packets(self, n):
+        """
+        Packets that start in file n, including a frame cut off by the end of the file
+        """
+        index = self._index(n)
+        count = len(index)
+        partial = getattr(index, 'partial', None)
+        if partial is not None and n + 1 < len(self.paths) and self._continues(n, partial):
+            count += 1
+        return count
+
+    def _continues(self, n, partial):
+        """
+        Whether file n+1 completes the frame cut off at the end of file n. A frame cut after
+        its first byte is only a frame if the next byte completes the header word.
+        """
+        if partial < self._index(n).size - 1:
+            return True
+        with captured_stream(self.paths[n + 1]) as instream:
+            head = bytearray(instream.read(1))
+        return bool(head) and bool(head[0] & HEADER_LOW_MASK)
+
+    def _first_packet(self, n):
+        while len(self._firsts) <= n:
+            known = len(self._firsts) - 1
+            self._firsts.append(self._firsts[known] + self.file_packets(known))
+        return self._firsts[n]
+
+    def __len__(self):
+        return self._first_packet(len(self.paths))
+
+    def locate(self, packet_number):
+        """
+        :return: (file number, packet number within that file)
+        """
+        if packet_number < 0:
+            raise IndexError('packet {} out of range'.format(packet_number))
+        n = 0
+        while n < len(self.paths):
+            if packet_number < self._first_packet(n + 1):
+                return n, packet_number - self._first_packet(n)
+            n += 1
+        raise IndexError('packet {} out of range'.format(packet_number))
+
+    def file_offsets(self):
+        """
+        :return: (path, first packet, time offset in ms) for every file
+        """
+        return [
+            (path, self._first_packet(n), self.time_of(self._first_packet(n)))
+            for n, path in enumerate(self.paths)
+        ]
+
+    def clock(self):
+        """
+        :rtype: MTS.Timing.PacketClock
+        """
+        if self._clock is None:
+            self._clock = PacketClock(capture_stamps(self.paths[0] if len(self.paths) == 1 else self.paths))
+        return self._clock
+
+    def time_of(self, packet_number):
+        return self.clock().time_of(packet_number)
+
+    def packet_at_time(self, time):
+        """
+        :param time: ms since the start of the session
+        """
+        return self.clock().packet_at_time(time)
+
+    def _open_at(self, packet_number):
+        n, local = self.locate(packet_number)
+        index = self._index(n)
+        path = self.paths[n]
+        if isinstance(index, BlockReader):
+            raw = BlockStream(io.open(path, mode='rb'))
+            raw.seek_packet(local)
+            first = io.BufferedReader(raw)
+        else:
+            first = io.open(path, mode='rb')
+            first.seek(index.offsets[local] if local < len(index) else index.partial)
+        return ChainedStream(self.paths[n:], first=first)
+
+    def frames(self, start=0):
+        """
+        :return: (global packet number, raw frame) from start to the end of the last file
+        """
+        stream = ChainedStream(self.paths) if start == 0 else self._open_at(start)
+        with io.BufferedReader(stream) as instream:
+            for number, frame in enumerate(read_frames(instream), start):
+                yield number, frame
+
+    def packets(self, start=0):
+        """
+        :return: (global packet number, time in ms, packet)
+        """
+        clock = self.clock()
+        for number, frame in self.frames(start):
+            yield number, clock.time_of(number), decode_frame(frame)
+
+    def frame(self, packet_number):
+        for _, frame in self.frames(packet_number):
+            return frame
+        raise IndexError('packet {} out of range'.format(packet_number))
@@ -0,0 +1,277 @@
+"""
+Receive timestamps for captured frames, and what they tell about the link.
+
+A live capture stamps every frame with a monotonic clock in nanoseconds when it is read.
+A read can return several frames at once; each is back-dated from the read by the line
+time of the bytes that came after it (see stamp_frames). Only live input is stamped: a
+capture read back from a file arrives as fast as the disk goes. CaptureWriter keeps the
+stamps in a sidecar next to each capture, <capture>.ts: an 8 byte magic followed by one
+unsigned 64 bit little endian value per frame, appended as the frames are written.
+
+Every time reported for a packet (columns, queries, CSV, events, the browser, sessions)
+comes from packet_clock(), or from PacketClock where packets are looked up out of order.
+
+Frames arrive every 81.92 ms, so a longer gap between two arrivals means frames were
+lost on the way; TimingStats counts them and collects the inter-arrival times.
+"""
+from __future__ import print_function, division
+import array
+import bisect
+import io
+import itertools
+import os
+import sys
+import time
+
+from MTS.Packet import PACKET_INTERVAL
+
+SUFFIX = '.ts'
+MAGIC = b'ISP2TS01'
+
+# Line time of one byte on the chain: 8N1 (10 bits) at 19200 baud
+BYTE_NS = 10 * 1000000000 // 19200
+
+if hasattr(time, 'monotonic_ns'):
+    monotonic_ns = time.monotonic_ns
+else:
+    _monotonic = getattr(time, 'monotonic', time.time)
+
+    def monotonic_ns():
+        return int(_monotonic() * 1e9)
+
+
+def ns_array(values=()):
+    try:
+        return array.array('Q', values)
+    except ValueError:
+        # Python 2 has no 'Q'; 'L' is 64 bits on the LP64 platforms we capture on
+        values = array.array('L', values)
+        if values.itemsize != 8:
+            raise
+        return values
+
+
+def _tobytes(values):
+    return values.tostring() if sys.version_info[0] < 3 else values.tobytes()
+
+
+def sidecar_path(path):
+    return path + SUFFIX
+
+
+def write_timestamps(out, values):
+    """
+    Append stamps to an open sidecar (the magic is written by the caller on creation)
+    """
+    values = ns_array(values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    out.write(_tobytes(values))
+
+
+def save_timestamps(path, values):
+    with io.open(path, mode='wb') as out:
+        out.write(MAGIC)
+        write_timestamps(out, values)
+
+
+def load_timestamps(path):
+    """
+    A trailing partial value (capture interrupted mid write) is ignored
+    :return: receive time of every frame, ns
+    """
+    with io.open(path, mode='rb') as instream:
+        if instream.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a timestamp file {}'.format(path))
+        body = instream.read()
+    values = ns_array()
+    body = body[:len(body) - len(body) % values.itemsize]
+    if sys.version_info[0] < 3:
+        values.fromstring(body)
+    else:
+        values.frombytes(body)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def timestamps_for(path, count=None):
+    """
+    Stamps from the sidecar of a capture, or None without one; also None (with a warning)
+    when count is given and the sidecar does not cover exactly that many frames
+    """
+    if not os.path.exists(sidecar_path(path)):
+        return None
+    try:
+        values = load_timestamps(sidecar_path(path))
+    except (IOError, OSError, ValueError) as e:
+        print('Ignoring timestamps for {}: {}'.format(path, e), file=sys.stderr)
+        return None
+    if count is not None and len(values) != count:
+        print('Ignoring timestamps for {}: {:d} stamps for {:d} frames'.format(path, len(values), count),
+              file=sys.stderr)
+        return None
+    return values
+
+
+def stamp_frames(received, frames, offsets, end, previous=0, byte_ns=BYTE_NS):
+    """
+    Receive stamps for the frames completed by one read. The read returned at received,
+    once the byte before stream offset end was in; a frame that ended n bytes earlier
+    completed n byte times before that. Stamps never go back past previous.
+    :param offsets: stream offset of the first byte of each frame
+    :rtype: list of int
+    """
+    stamps = []
+    for start, frame in zip(offsets, frames):
+        previous = max(previous, received - int((end - start - len(frame)) * byte_ns))
+        stamps.append(previous)
+    return stamps
+
+
+def capture_stamps(path):
+    """
+    Stamps of a single capture when its sidecar covers exactly its frames, else None;
+    always None for a list of captures read as one session
+    """
+    if isinstance(path, (list, tuple)) or not os.path.exists(sidecar_path(path)):
+        return None
+    from MTS.Session import Session
+    return timestamps_for(path, len(Session([path])))
+
+
+def packet_clock(stamps=None):
+    """
+    ms since the first packet, one value per packet and without end: from the receive
+    stamps while they last, then on at PACKET_INTERVAL
+    """
+    last = 0.0
+    stamped = 0
+    for last in relative_ms(stamps) if stamps else ():
+        stamped += 1
+        yield last
+    for n in itertools.count(1 if stamped else 0):
+        yield last + n * PACKET_INTERVAL
+
+
+def packet_times(count, stamps=None):
+    """
+    :return: the first count values of packet_clock(stamps)
+    """
+    return array.array('d', itertools.islice(packet_clock(stamps), count))
+
+
+class PacketClock(object):
+    """
+    packet_clock() by packet number, and back from a time to a packet
+    """
+
+    def __init__(self, stamps=None):
+        super(PacketClock, self).__init__()
+        self._times = relative_ms(stamps) if stamps else array.array('d')
+
+    def time_of(self, packet_number):
+        """
+        :return: ms since the first packet
+        """
+        stamped = len(self._times)
+        if packet_number < stamped:
+            return self._times[packet_number]
+        if not stamped:
+            return packet_number * PACKET_INTERVAL
+        return self._times[-1] + (packet_number - stamped + 1) * PACKET_INTERVAL
+
+    def packet_at_time(self, ms):
+        """
+        :param ms: ms since the first packet
+        :return: the last packet at or before ms; 0 before the first
+        """
+        stamped = len(self._times)
+        if stamped and ms < self._times[-1]:
+            return max(bisect.bisect_right(self._times, ms) - 1, 0)
+        last = self._times[-1] if stamped else 0.0
+        return max(max(stamped - 1, 0) + int((ms - last) // PACKET_INTERVAL), 0)
+
+
+def relative_ms(values):
+    """
+    :return: ms since the first stamp, per stamp
+    """
+    if not len(values):
+        return array.array('d')
+    first = values[0]
+    return array.array('d', [(v - first) / 1e6 for v in values])
+
+
+def percentile(ordered, point):
+    """
+    Nearest rank percentile of an already sorted sequence
+    """
+    if not ordered:
+        return float('nan')
+    rank = int(round(point / 100.0 * (len(ordered) - 1)))
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class TimingStats(object):
+    """
+    Gaps and jitter from a sequence of receive stamps.
+
+    An arrival more than (1 + tolerance) packet intervals after the previous one is a gap;
+    the frames that should have arrived in it are counted as missing. Every other
+    inter-arrival time is kept for the jitter percentiles.
+    """
+
+    def __init__(self, interval=PACKET_INTERVAL, tolerance=0.5):
+        super(TimingStats, self).__init__()
+        self.interval = interval
+        self._threshold_ns = interval * (1 + tolerance) * 1e6
+        self.frames = 0
+        self.missing = 0
+        # (packet number after the gap, gap in ms, frames missing)
+        self.gaps = []
+        self.intervals = array.array('d')
+        self._previous = None
+        self._previous_number = None
+
+    def feed(self, received, packet_number=None):
+        """
+        :param received: receive stamp, ns
+        :param packet_number: when some frames were not fed (e.g. a sink dropped them), so
+            their absence is not mistaken for a gap on the wire
+        """
+        if packet_number is None:
+            packet_number = self.frames
+        previous, self._previous = self._previous, received
+        consecutive = self._previous_number is not None and packet_number == self._previous_number + 1
+        self._previous_number = packet_number
+        self.frames += 1
+        if previous is None or not consecutive:
+            return
+        elapsed = received - previous
+        if elapsed > self._threshold_ns:
+            missing = int(round(elapsed / (self.interval * 1e6))) - 1
+            self.missing += missing
+            self.gaps.append((packet_number, elapsed / 1e6, missing))
+        else:
+            self.intervals.append(elapsed / 1e6)
+
+    def extend(self, values):
+        for received in values:
+            self.feed(received)
+        return self
+
+    def percentiles(self, points=(50, 90, 99, 99.9)):
+        """
+        :return: (point, inter-arrival ms, jitter ms) where jitter is the distance from
+            the packet interval
+        """
+        ordered = sorted(self.intervals)
+        jitter = sorted(abs(v - self.interval) for v in self.intervals)
+        return [(p, percentile(ordered, p), percentile(jitter, p)) for p in points]
+
+    def report(self, outstream=sys.stderr):
+        print('frames={:d} gaps={:d} missing={:d}'.format(self.frames, len(self.gaps), self.missing),
+              file=outstream)
+        for point, interval, jitter in self.percentiles():
+            print(' p{:<5g} interval={:7.2f}ms jitter={:6.2f}ms'.format(point, interval, jitter), file=outstream)
@@ -3,5 +3,8 @@
 # Packet periodicity: 81.92 milliseconds (12.2 hertz) (8 MHz / 655360)
 # Sample resolution: 10 bits (0..5V at 0.1% resolution)
 
-import Header
-from word import *
+from MTS import Header
+from MTS.word import *
+
+# Bump whenever decoded output changes; keys the decode cache
+DECODER_VERSION = 2
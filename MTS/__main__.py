@@ -0,0 +1,300 @@
+"""
+Command line entry point: python -m MTS <command> [options]
+
+Only argparse is imported up front; each command imports what it needs when it runs,
+so the decode-only commands never pay for the terminal, scheduler or serial libraries.
+"""
+from __future__ import print_function, division
+import argparse
+import errno
+import io
+import json
+import sys
+
+SETTINGS_PATH = 'settings.json'
+
+
+def default_input():
+    try:
+        with io.open(SETTINGS_PATH, mode='r') as js:
+            return json.load(js).get('input_file')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _input_path(args):
+    """
+    :return: one path, or a list of paths to be read as one continuous session
+    """
+    path = args.input
+    if isinstance(path, list):
+        path = path[0] if len(path) == 1 else (path or None)
+    if path is None:
+        path = default_input()
+    if path is None:
+        raise SystemExit('No input file given and none configured in {}'.format(SETTINGS_PATH))
+    return path
+
+
+def cmd_dump(args):
+    from MTS.Packet import format_packet
+    from MTS.stream import captured_stream, read_frames, decode_frame
+
+    outstream = io.open(args.raw, mode='wb') if args.raw else None
+    try:
+        with captured_stream(_input_path(args)) as instream:
+            for i, frame in enumerate(read_frames(instream)):
+                print(format_packet(i, decode_frame(frame)))
+                if outstream is not None:
+                    outstream.write(frame)
+    finally:
+        if outstream is not None:
+            outstream.close()
+
+
+def cmd_replay(args):
+    if args.serve is None and args.unix is None:
+        import replay
+        replay.main(input_path=_input_path(args), tty=args.tty)
+        return
+    import logging
+    from MTS.ReplayServer import ReplayServer, frames_from_file
+
+    logging.basicConfig(level=logging.INFO)
+    address = None
+    if args.serve is not None:
+        host, _, port = args.serve.rpartition(':')
+        address = (host or '127.0.0.1', int(port))
+    server = ReplayServer(frames_from_file(_input_path(args), repeat=args.loop), address=address,
+                          unix_path=args.unix, max_buffer=args.max_buffer)
+    if server.address is not None:
+        print('Serving on {}:{}'.format(*server.address), file=sys.stderr)
+    if args.unix is not None:
+        print('Serving on {}'.format(args.unix), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('frames={:d} clients={:d} slow={:d} late={:.1f}ms'.format(
+        server.frames, server.accepted, server.dropped_slow, server.max_late * 1000), file=sys.stderr)
+
+
+def cmd_browse(args):
+    from termapp.Browser import main as browse
+    browse(_input_path(args))
+
+
+def cmd_swap(args):
+    from MTS.stream import captured_stream, swap_words
+
+    with captured_stream(_input_path(args)) as instream, io.open(args.output, mode='wb') as outstream:
+        bytecount = swap_words(instream, outstream)
+    print('Wrote {} bytes to {}'.format(bytecount, args.output), file=sys.stderr)
+
+
+def cmd_index(args):
+    from MTS.FrameIndex import FrameIndex
+    from MTS.BlockStore import BlockReader, is_block_file
+
+    path = _input_path(args)
+    with io.open(path, mode='rb') as instream:
+        if is_block_file(instream.read(8)):
+            reader = BlockReader(instream)
+            print('{}: block capture; {:d} packets in {:d} blocks'.format(path, len(reader), len(reader.blocks)))
+            return
+    index = FrameIndex.for_file(path, save=True)
+    print('{}: {:d} frames indexed in {}'.format(path, len(index), FrameIndex.sidecar_path(path)))
+
+
+def cmd_convert(args):
+    from MTS.stream import captured_stream, read_frames, read_gaps_and_frames
+
+    path = _input_path(args)
+    with captured_stream(path) as instream:
+        if args.format == 'blocks':
+            from MTS.BlockStore import BlockWriter
+            with io.open(args.output, mode='wb') as out, \
+                    BlockWriter(out, codec=args.codec, frames_per_block=args.block_frames, dedup=args.dedup) as writer:
+                for gap, frame in read_gaps_and_frames(instream):
+                    writer.write_gap(gap)
+                    if frame is not None:
+                        writer.write(frame)
+        elif args.format == 'raw':
+            with io.open(args.output, mode='wb') as out:
+                for frame in read_frames(instream):
+                    out.write(frame)
+        else:
+            from MTS.Calibration import load_calibrations
+            from MTS.Timing import capture_stamps
+            with io.open(args.output, mode='w') as out:
+                write_csv(read_frames(instream), out, calibrations=load_calibrations(SETTINGS_PATH),
+                          stamps=capture_stamps(path))
+
+
+def write_csv(frames, out, calibrations=None, stamps=None):
+    """
+    One row per packet; calibrated channels get a column each, after the raw aux values
+    :param stamps: receive stamps of the frames, for time_ms (see MTS.Timing.packet_clock)
+    """
+    from MTS.Timing import packet_clock
+    from MTS.stream import decode_frame
+
+    calibrated = calibrations.items() if calibrations else []
+    out.write(u'packet,time_ms,function,lambda,afr,aux{}\n'.format(
+        ''.join(u',{}'.format(c.name) for _, c in calibrated)
+    ))
+    for i, (frame, time_ms) in enumerate(zip(frames, packet_clock(stamps))):
+        packet = decode_frame(frame)
+        function = packet.function()
+        try:
+            afr = '{:.3f}'.format(packet.air_fuel_ratio()) if function is not None else ''
+        except ValueError:
+            afr = ''
+        lambda_value = packet.lambda_value()
+        channels = packet.aux_channels()
+        out.write(u'{:d},{:.2f},{},{},{},{}{}\n'.format(
+            i,
+            time_ms,
+            function or '',
+            '' if lambda_value is None else lambda_value,
+            afr,
+            ' '.join(['{:d}'.format(a.aux()) for a in channels]),
+            ''.join(u',{:.6g}'.format(c.table[channels[n].aux()]) if n < len(channels) else u','
+                    for n, c in calibrated)
+        ))
+
+
+def cmd_stats(args):
+    from collections import Counter
+    from MTS import FUNCTION_LAMBDA_MASK, FUNCTION_LM_MASK, FUNCTION_LM
+    from MTS.Packet import PACKET_INTERVAL, Functions
+    from MTS.stream import FrameParser, captured_stream, read_frames
+
+    parser = FrameParser()
+    functions = Counter()
+    lengths = Counter()
+    packets = 0
+    with captured_stream(_input_path(args)) as instream:
+        for frame in read_frames(instream, parser=parser):
+            packets += 1
+            lengths[len(frame) // 2] += 1
+            if len(frame) >= 4:
+                word = (bytearray(frame[2:3])[0] << 8) | bytearray(frame[3:4])[0]
+                if word & FUNCTION_LAMBDA_MASK == FUNCTION_LAMBDA_MASK or word & FUNCTION_LM_MASK == FUNCTION_LM:
+                    functions[Functions[(word >> 10) & 0b111]] += 1
+    print('packets:  {:d}'.format(packets))
+    print('duration: {:.1f} s'.format(packets * PACKET_INTERVAL / 1000))
+    print('skipped:  {:d} bytes'.format(parser.skipped))
+    print('trailing: {:d} bytes'.format(parser.pending()))
+    for words, count in sorted(lengths.items()):
+        print('  {:2d} words: {:d}'.format(words, count))
+    for name, count in functions.most_common():
+        print('  {}: {:d}'.format(name, count))
+
+
+def cmd_timing(args):
+    from MTS.Timing import TimingStats, load_timestamps, sidecar_path
+
+    path = _input_path(args)
+    try:
+        stamps = load_timestamps(sidecar_path(path))
+    except (IOError, OSError) as e:
+        raise SystemExit('No receive timestamps for {}: {}'.format(path, e))
+    stats = TimingStats().extend(stamps)
+    stats.report(sys.stdout)
+    for packet, gap, missing in stats.gaps:
+        print('  gap before packet {:d}: {:.1f}ms, {:d} missing'.format(packet, gap, missing))
+
+
+def cmd_query(args):
+    from MTS.Calibration import load_calibrations
+    from MTS.Query import QueryError, search
+
+    paths = args.inputs or [_input_path(args)]
+    try:
+        for path, first, stop, start_ms, stop_ms in search(paths, args.expression,
+                                                           calibrations=load_calibrations(SETTINGS_PATH)):
+            print('{} packets {:d}-{:d} ({:.2f}s - {:.2f}s)'.format(
+                path, first, stop - 1, start_ms / 1000, stop_ms / 1000
+            ))
+    except QueryError as e:
+        raise SystemExit(str(e))
+
+
+def cmd_events(args):
+    from MTS.Events import default_detectors, detect_file
+
+    detectors = default_detectors(aux_channels=[c - 1 for c in args.aux])
+    for event in detect_file(_input_path(args), detectors):
+        print('{:10.2f}s {:6d} {:12s} {}'.format(
+            event.time / 1000, event.packet, event.kind,
+            ' '.join('{}={}'.format(k, _detail_value(v)) for k, v in sorted(event.detail.items()))
+        ))
+
+
+def _detail_value(value):
+    # Same text on Python 2 and 3, whose str(float) differ
+    return '{:.12g}'.format(value) if isinstance(value, float) else value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m MTS', description='Innovate MTS serial protocol tools')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    def command(name, func, help_text, needs_output=False, session=False):
+        sub = commands.add_parser(name, help=help_text)
+        if session:
+            sub.add_argument('input', nargs='*', help='capture files, read back to back as one session '
+                                                      '(default: input_file in {})'.format(SETTINGS_PATH))
+        else:
+            sub.add_argument('input', nargs='?', help='capture file (default: input_file in {})'.format(SETTINGS_PATH))
+        if needs_output:
+            sub.add_argument('-o', '--output', required=True, help='output file')
+        sub.set_defaults(func=func)
+        return sub
+
+    dump = command('dump', cmd_dump, 'decode and print every packet', session=True)
+    dump.add_argument('--raw', help='also write the raw ISP2 frames to this file')
+    replay = command('replay', cmd_replay, 'replay a capture to a serial port in real time', session=True)
+    replay.add_argument('--tty', default='cu.UC-232AC', help='serial device name under /dev')
+    replay.add_argument('--serve', metavar='[HOST:]PORT', help='serve the stream over TCP instead of a serial port')
+    replay.add_argument('--unix', metavar='PATH', help='serve the stream on a Unix socket')
+    replay.add_argument('--loop', action='store_true', help='start over at the end of the capture (server)')
+    replay.add_argument('--max-buffer', type=int, default=16 * 1024,
+                        help='bytes a client may fall behind before it is disconnected (server)')
+    command('browse', cmd_browse, 'page through a capture in the terminal')
+    command('swap', cmd_swap, 'swap the byte order of every word', needs_output=True)
+    command('index', cmd_index, 'build the frame offset index sidecar')
+    convert = command('convert', cmd_convert, 'export as CSV, raw ISP2 or block-compressed ISP2', needs_output=True,
+                      session=True)
+    convert.add_argument('--format', choices=('csv', 'raw', 'blocks'), default='csv',
+                         help='csv and raw keep whole frames only; blocks keep every byte, so they expand '
+                              'back to the original capture')
+    convert.add_argument('--codec', choices=('zlib', 'lzma'), default='zlib', help='block compression')
+    convert.add_argument('--block-frames', type=int, default=1024, help='frames per compressed block')
+    convert.add_argument('--dedup', action='store_true', help='store identical consecutive frames once (blocks)')
+    command('stats', cmd_stats, 'summarise a capture', session=True)
+    command('timing', cmd_timing, 'gaps and jitter from the receive timestamps of a live capture')
+    events = command('events', cmd_events, 'warmup, function changes, lean/rich excursions and aux dropouts',
+                     session=True)
+    events.add_argument('--aux', type=int, action='append', default=[], help='watch this aux channel (1 based) for dropouts')
+    query = commands.add_parser('query', help='find packet ranges matching an expression, e.g. "afr > 14.7"')
+    query.add_argument('expression')
+    query.add_argument('inputs', nargs='*', help='capture files (default: input_file in {})'.format(SETTINGS_PATH))
+    query.set_defaults(func=cmd_query, input=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except IOError as e:
+        # e.g. output piped into head
+        if e.errno != errno.EPIPE:
+            raise
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+The asyncio implementation behind MTS.AsyncReader; Python 3 syntax, so import that instead.
+"""
+import asyncio
+import collections
+import os
+import termios
+import time
+
+from MTS.stream import FrameParser
+from MTS.Timing import stamp_frames
+
+SourcedFrame = collections.namedtuple('SourcedFrame', 'source received frame')
+
+_EOF = object()
+
+
+def open_port(path, baudrate=19200):
+    """
+    Open a serial device or pseudo-terminal non-blocking, raw 8-N-1
+    :return: file descriptor
+    """
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        if os.isatty(fd):
+            speed = getattr(termios, 'B{:d}'.format(baudrate))
+            iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(fd)
+            iflag = 0
+            oflag = 0
+            lflag = 0
+            cflag = (cflag & ~(termios.CSIZE | termios.PARENB | termios.CSTOPB)) | termios.CS8 | termios.CREAD | termios.CLOCAL
+            termios.tcsetattr(fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+class AsyncReader(object):
+    """
+    :param devices: source name -> device path (or an already open file descriptor)
+    :param maxsize: merged queue bound; when full the oldest frame is dropped
+    """
+
+    def __init__(self, devices, maxsize=1024, chunk_size=4096, loop=None):
+        self._devices = dict(devices)
+        self._maxsize = maxsize
+        self._chunk_size = chunk_size
+        self._loop = loop
+        self._queue = None
+        self._fds = {}
+        self._owned = set()
+        self.parsers = {}
+        self._offsets = {}
+        self._previous = collections.Counter()
+        self.frames = collections.Counter()
+        self.dropped = 0
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def open(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self._maxsize)
+        for source, device in self._devices.items():
+            if isinstance(device, int):
+                fd = device
+            else:
+                fd = open_port(device)
+                self._owned.add(fd)
+            self._fds[source] = fd
+            self._offsets[source] = []
+            self.parsers[source] = FrameParser(offsets=self._offsets[source])
+            self._loop.add_reader(fd, self._on_readable, source)
+
+    def close(self):
+        for source in list(self._fds):
+            self._detach(source)
+        if self._queue is not None:
+            # Wake anyone waiting in __anext__
+            self._put(_EOF)
+
+    def _detach(self, source):
+        fd = self._fds.pop(source)
+        self._loop.remove_reader(fd)
+        if fd in self._owned:
+            self._owned.discard(fd)
+            os.close(fd)
+
+    def _put(self, item):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+
+    def _on_readable(self, source):
+        try:
+            data = os.read(self._fds[source], self._chunk_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            # e.g. EIO once the other end of a pseudo-terminal closes
+            data = b''
+        if not data:
+            self._detach(source)
+            if not self._fds:
+                self._put(_EOF)
+            return
+        received = time.monotonic_ns()
+        parser = self.parsers[source]
+        offsets = self._offsets[source]
+        frames = parser.feed(data)
+        stamps = stamp_frames(received, frames, offsets, parser.position(), self._previous[source])
+        del offsets[:]
+        for stamp, frame in zip(stamps, frames):
+            self.frames[source] += 1
+            self._put(SourcedFrame(source, stamp, frame))
+        if stamps:
+            self._previous[source] = stamps[-1]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._queue is None:
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _EOF:
+            # Leave it for any other waiter, and for the next call
+            self._put(_EOF)
+            raise StopAsyncIteration
+        return item
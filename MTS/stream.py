@@ -0,0 +1,276 @@
+from __future__ import print_function, division
+import io
+import struct
+import sys
+
+from MTS.Header import Header
+from MTS.Packet import Packet
+from MTS.word.HeaderWord import HeaderWord
+
+# Header word: bits 15, 13 and 9 in the high byte; bit 7 in the low byte
+HEADER_HIGH_MASK = HeaderWord.MAGIC_MASK >> 8
+HEADER_LOW_MASK = HeaderWord.MAGIC_MASK & 0x00FF
+
+
+def frame_length(headerword):
+    """
+    Total frame size in bytes, including the header word
+    :type headerword: int
+    :rtype: int
+    """
+    return 2 + 2 * (((headerword & 0x0100) >> 1) | (headerword & 0x007F))
+
+
+def scan_to_headerword(serial_input, maximum_bytes=9999, header_magic=HeaderWord.MAGIC_MASK):
+    """
+    Consume bytes until header magic is found in a word
+    :param header_magic:
+    :param maximum_bytes:
+    :param serial_input:
+    :rtype : MTS.Header.Header
+    """
+    headerword = 0x0000
+    bytecount = 0
+
+    while headerword & header_magic != header_magic:
+        # BlockingIOError
+        # Read a single byte
+        nextbyte = serial_input.read(1)
+        if len(nextbyte) == 0:
+            raise BufferError("Reached end of stream")
+        bytecount += 1
+        # Take the low word and shift it high; Use OR to add this byte
+        nextint = ord(nextbyte)
+        headerword = ((headerword & 0x00FF) << 8) | nextint
+
+        if 0 < maximum_bytes <= bytecount:
+            raise BufferError("Failed to detect header word in serial stream")
+
+    try:
+        return Header(word=headerword)
+    except ValueError as e:
+        print("Invalid header word 0x{:04X}".format(headerword), file=sys.stderr)
+        raise e
+
+
+def read_packets(serial_input, chunk_size=io.DEFAULT_BUFFER_SIZE, parser=None):
+    """
+    Consume bytes from input, creating packet frames of words; framed by read_frames(), so
+    packets are numbered the same as by dump, the frame index and sessions.
+    Keep the generator: input it has read ahead is buffered in its parser.
+    :rtype: MTS.Packet.Packet
+    :type serial_input:
+    """
+    return decode_frames(read_frames(serial_input, chunk_size, parser))
+
+
+class FrameParser(object):
+    """
+    Incremental ISP2 framer; feed it chunks of any size and collect whole frames.
+
+    Bytes before a header word are skipped (and counted) the same way
+    scan_to_headerword() does, so a stream can be joined mid-packet.
+    """
+
+    def __init__(self, offsets=None, gaps=None):
+        """
+        :param offsets: optional list/array; the stream offset of every frame is appended to it
+        :param gaps: optional list; the bytes skipped just before every frame (b'' when
+            none) are appended to it, so frames and gaps together give back the stream
+        """
+        super(FrameParser, self).__init__()
+        self._buffer = bytearray()
+        self._position = 0
+        self._offsets = offsets
+        self._gaps = gaps
+        self._gap = bytearray()
+        self.skipped = 0
+
+    def feed(self, data):
+        """
+        :type data: bytes
+        :return: complete frames (header word included) found so far
+        :rtype: list of bytes
+        """
+        buf = self._buffer
+        buf.extend(data)
+        frames = []
+        offsets = self._offsets
+        gaps = self._gaps
+        size = len(buf)
+        pos = 0
+        # Start of the bytes skipped since the last frame
+        mark = 0
+        while pos + 1 < size:
+            if buf[pos] & HEADER_HIGH_MASK == HEADER_HIGH_MASK and buf[pos + 1] & HEADER_LOW_MASK:
+                end = pos + frame_length((buf[pos] << 8) | buf[pos + 1])
+                if end > size:
+                    break
+                frames.append(bytes(buf[pos:end]))
+                if offsets is not None:
+                    offsets.append(self._position + pos)
+                if gaps is not None:
+                    self._gap.extend(buf[mark:pos])
+                    gaps.append(bytes(self._gap))
+                    del self._gap[:]
+                pos = mark = end
+            else:
+                pos += 1
+                self.skipped += 1
+        if gaps is not None:
+            self._gap.extend(buf[mark:pos])
+        del buf[:pos]
+        self._position += pos
+        return frames
+
+    def position(self):
+        """
+        :return: stream offset just past the last byte fed
+        """
+        return self._position + len(self._buffer)
+
+    def pending(self):
+        """
+        :return: count of buffered bytes not yet part of a complete frame
+        """
+        return len(self._buffer)
+
+    def tail(self):
+        """
+        Only kept when parsing with gaps
+        :return: the bytes after the last complete frame: skipped bytes, then any
+            unfinished frame
+        """
+        return bytes(self._gap + self._buffer)
+
+    def partial_offset(self):
+        """
+        :return: stream offset of a frame that has started but not completed, or None;
+            a lone trailing byte that could be the high byte of a header word counts
+        """
+        buf = self._buffer
+        if not buf or buf[0] & HEADER_HIGH_MASK != HEADER_HIGH_MASK:
+            return None
+        if len(buf) > 1 and not buf[1] & HEADER_LOW_MASK:
+            return None
+        return self._position
+
+
+def read_size(serial_input, chunk_size):
+    # Serial ports block until the full request arrives; only ask for what is waiting
+    waiting = getattr(serial_input, 'in_waiting', None)
+    if waiting is None:
+        return chunk_size
+    return max(1, waiting)
+
+
+def read_frames(serial_input, chunk_size=io.DEFAULT_BUFFER_SIZE, parser=None):
+    """
+    Consume input in chunks, yielding raw (big endian) frames including the header word.
+    Ends quietly at end of stream.
+    :rtype: bytes
+    """
+    if parser is None:
+        parser = FrameParser()
+    while 1:
+        chunk = serial_input.read(read_size(serial_input, chunk_size))
+        if not chunk:
+            return
+        for frame in parser.feed(chunk):
+            yield frame
+
+
+def frame_words(frame):
+    """
+    :type frame: bytes
+    :rtype: tuple of int
+    """
+    return struct.unpack('>{:d}H'.format(len(frame) // 2), frame)
+
+
+def read_gaps_and_frames(serial_input, chunk_size=io.DEFAULT_BUFFER_SIZE):
+    """
+    Every input byte exactly once, for storing a capture losslessly: (gap, frame) for each
+    frame, gap being the bytes skipped just before it; then (tail, None) when the stream
+    ends with bytes that are not a complete frame.
+    """
+    gaps = []
+    parser = FrameParser(gaps=gaps)
+    while 1:
+        chunk = serial_input.read(read_size(serial_input, chunk_size))
+        if not chunk:
+            break
+        frames = parser.feed(chunk)
+        for gap, frame in zip(gaps, frames):
+            yield gap, frame
+        del gaps[:]
+    tail = parser.tail()
+    if tail:
+        yield tail, None
+
+
+def decode_frame(frame):
+    """
+    Decode a raw frame produced by read_frames()
+    :rtype: MTS.Packet.Packet
+    """
+    words = frame_words(frame)
+    return Packet(Header(word=words[0]), list(words[1:]))
+
+
+def decode_frames(frames):
+    for frame in frames:
+        yield decode_frame(frame)
+
+
+def swap_words(instream, outstream, chunk_size=io.DEFAULT_BUFFER_SIZE):
+    """
+    Swap the byte order of every 16 bit word; e.g. little endian storage dumps to ISP2
+    :return: count of bytes written
+    """
+    bytecount = 0
+    carry = b''
+    while 1:
+        chunk = instream.read(chunk_size)
+        if not chunk:
+            break
+        data = carry + chunk
+        even = len(data) & ~1
+        carry = data[even:]
+        swapped = bytearray(even)
+        swapped[0::2] = data[1:even:2]
+        swapped[1::2] = data[0:even:2]
+        outstream.write(bytes(swapped))
+        bytecount += even
+    if carry:
+        print("Lonely byte", file=sys.stderr)
+    return bytecount
+
+
+def captured_stream(filename='Serial-log.isp2'):
+    """
+    Open a capture for reading; block-compressed captures are decompressed transparently.
+    A list of files is read back to back as one continuous stream.
+    """
+    if isinstance(filename, (list, tuple)):
+        from MTS.Session import ChainedStream
+        return io.BufferedReader(ChainedStream(filename))
+    stream = io.open(
+        filename,
+        mode='rb',
+        buffering=io.DEFAULT_BUFFER_SIZE
+    )
+    if stream.peek(8)[:8] == b'ISP2BLK1':
+        from MTS.BlockStore import open_blocks
+        return open_blocks(stream)
+    return stream
+
+
+def live_stream(tty='cu.usbserial', timeout=None):
+    import serial
+    from serial import SerialException
+    try:
+        return serial.Serial('/dev/{}'.format(tty), 19200, timeout=timeout)
+    except (OSError, SerialException) as e:
+        print("Failed to open port: {}".format(e), file=sys.stderr)
+    return None
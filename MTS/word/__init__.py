@@ -1,2 +1,4 @@
 FUNCTION_LAMBDA_MASK = 0x4200
-FUNCTION_LM_MASK = 0x0080
+# LM-1 function word: bit 15 set, bits 13, 9 and 7 clear; bit 14 is its recording flag
+FUNCTION_LM_MASK = 0xA280
+FUNCTION_LM = 0x8000
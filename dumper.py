@@ -1,117 +1,75 @@
 from __future__ import print_function, division
-import struct
+import os
 import sys
-import io
 
-import MTS
-
-from MTS.Header import Header
-from MTS.word.HeaderWord import HeaderWord
+from MTS.Capture import CapturePipeline, RawFileSink, ForwardSink, TimingSink, console_sink, DROP_OLDEST, BLOCK
+from MTS.CaptureWriter import CaptureWriter
+from MTS.Packet import format_packet
+from MTS.stream import scan_to_headerword, read_packets, captured_stream, live_stream
 
 __author__ = 'rob'
 
 
-def scan_to_headerword(serial_input, maximum_bytes=9999, header_magic=HeaderWord.MAGIC_MASK):
-    """
-    Consume bytes until header magic is found in a word
-    :param header_magic:
-    :param maximum_bytes:
-    :param serial_input:
-    :rtype : MTS.Header.Header
-    """
-    headerword = 0x0000
-    bytecount = 0
-
-    while headerword & header_magic != header_magic:
-        # BlockingIOError
-        # Read a single byte
-        nextbyte = serial_input.read(1)
-        if len(nextbyte) == 0:
-            raise BufferError("Reached end of stream")
-        bytecount += 1
-        # Take the low word and shift it high; Use OR to add this byte
-        nextint = ord(nextbyte)
-        # if DEBUG: print('0x{byte:02X} {byte:08b}'.format(byte=nextint))
-        headerword = ((headerword & 0x00FF) << 8) | nextint
-
-        if 0 < maximum_bytes <= bytecount:
-            raise BufferError("Failed to detect header word in serial stream")
-
-    try:
-        h = MTS.Header.Header(word=headerword)
-        # if DEBUG: print("Found header word. 0x{:04X}".format(h.word))
-        return h
-    except ValueError as e:
-        print("Invalid header word 0x{:04X}".format(headerword))
-        raise e
+def print_packet(i, packet):
+    print(format_packet(i, packet))
 
 
-def read_packets(serial_input):
+def dump(instream, outstream=None, forward=None, live=False):
     """
-    Consume bytes from input, creating packet frames of words
-    :rtype: MTS.Packet.Packet
-    :type serial_input:
+    Print every packet, optionally saving the raw frames and forwarding them to another port.
+    Each output runs on its own thread so a slow one cannot hold up reading the input.
+    :rtype: MTS.Capture.CapturePipeline
     """
-    while 1:
-        header = scan_to_headerword(serial_input)
-        yield header.read_packet(serial_input)
-
-
-def captured_stream(filename='Serial-log.isp2'):
-    return io.open(
-        filename,
-        mode='rb',
-        buffering=io.DEFAULT_BUFFER_SIZE
-    )
-
-# StampedMarker = namedtuple('StampedMarker', 'counter clock')
-
-
-def live_stream(tty='cu.usbserial'):
-    import serial
+    if not live and getattr(outstream, 'timestamps', False):
+        raise ValueError('Receive timestamps are only recorded for live input')
+    # Files can wait for a slow console; a serial port cannot
+    policy = DROP_OLDEST if live else BLOCK
+    pipeline = CapturePipeline(instream, live=live)
+    pipeline.add_sink(console_sink(policy=policy))
+    if outstream is not None:
+        pipeline.add_sink(RawFileSink(
+            outstream,
+            maxsize=4096,
+            policy=policy,
+            flush_every=None if isinstance(outstream, CaptureWriter) else 100
+        ))
+    if forward is not None:
+        pipeline.add_sink(ForwardSink(forward, policy=policy))
+    # Arrival times only mean something when reading the wire
+    timing = pipeline.add_sink(TimingSink(policy=policy)) if live else None
     try:
-        return serial.Serial('/dev/{}'.format(tty), 19200)
-    except OSError as e:
-        print("Failed to open port", file=sys.stderr)
-    return None
-
-
-def print_packet(i, packet):
-    print("{: 5d} 0x{} {}".format(
-        i,
-        '-'.join(['{:04X}'.format(word) for word in packet.words()]),
-        packet.data_line()
-    ))
-
-
-def dump(instream, outstream=None):
-    for i, packet in enumerate(read_packets(instream)):
-        # Raw dump to screen
-        allwords = packet.words()
-        print_packet(i, packet)
-        outstream.write(struct.pack('{:d}H'.format(len(allwords)), *allwords))
-        if i % 100 == 0:
-            outstream.flush()
-            # print('Flush.', file=sys.stderr)
+        pipeline.run()
+    except KeyboardInterrupt:
+        pass
+    pipeline.report()
+    if timing is not None:
+        timing.timing.report()
+    return pipeline
 
 
 if __name__ == '__main__':
     import tempfile
-    outwrapper = tempfile.NamedTemporaryFile(suffix='.ISP2', delete=False)
-    outwrapper.close()
-    outfile = io.open(outwrapper.name, mode='w+b')
-    print('Logging raw data to temp file: {}'.format(outwrapper.name), file=sys.stderr)
+    # True when reading one of the live_stream()s below
+    live = False
+    # One file per ten minutes of driving; fsync at most every 5 seconds
+    outfile = CaptureWriter(
+        directory=tempfile.gettempdir(),
+        prefix='dumper',
+        max_seconds=600,
+        fsync_interval=5.0,
+        timestamps=live
+    )
+    print('Logging raw data to {}'.format(os.path.join(outfile.directory, outfile.prefix + '-*.ISP2')), file=sys.stderr)
     try:
         # scan_swappedwords(captured_stream())
         dump(
             # live_stream('cu.usbserial'),
             captured_stream('dumped-fromstorage.swapped.ISP2'),
             # live_stream('cu.UC-232AC'),
-            outfile
+            outfile,
+            live=live
         )
-    except BufferError as e:
-        print("All done; {}".format(e))
+        print("All done.")
     finally:
-        if outfile is not None:
-            outfile.close()
-
+        outfile.close()
+        print('Wrote {}'.format(', '.join(outfile.paths)), file=sys.stderr)
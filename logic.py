@@ -2,7 +2,6 @@ from __future__ import print_function
 import io
 from collections import defaultdict
 
-import saleae
 import tempfile
 
 import sys
@@ -38,14 +37,25 @@ def merge_analyzers(inputs, add_header=False):
     return csv
 
 
-# Take a reference to the Socket API bridge
-_s = saleae.Saleae()
+# Reference to the Socket API bridge; see connect()
+_s = None
+
+
+def connect():
+    """
+    Take a reference to the Socket API bridge; Logic must be running.
+    """
+    global _s
+    import saleae
+    _s = saleae.Saleae()
+    return _s
 
 
 if __name__ == '__main__':
     import tempfile
 
     # print('Logging raw data to temp file: {}'.format(outwrapper.name), file=sys.stderr)
+    connect()
 
     print('Analysers:')
     exported = []
@@ -1,6 +1,5 @@
 from __future__ import print_function, division
 
-import io
 import logging
 import os
 import struct
@@ -12,8 +11,7 @@ from blessed import Terminal
 from blessed.keyboard import Keystroke
 
 import MTS
-from MTS.Packet import packet_tostring
-from MTS.word.HeaderWord import HeaderWord
+from MTS.stream import read_packets, live_stream, captured_stream
 from termapp.Display import Display
 
 from termapp.settings import Settings
@@ -35,62 +33,6 @@ if 'PYDEVD_EGG' in os.environ:
         os.environ['TERM'] = env_term
 
 
-def scan_to_headerword(serial_input, maximum_bytes=9999, header_magic=HeaderWord.MAGIC_MASK):
-    """
-    Consume bytes until header magic is found in a word
-    :param header_magic:
-    :param maximum_bytes:
-    :param serial_input:
-    :rtype : MTS.Header.Header
-    """
-    headerword = 0x0000
-    bytecount = 0
-
-    while headerword & header_magic != header_magic:
-        # BlockingIOError
-        # Read a single byte
-        nextbyte = serial_input.read(1)
-        if len(nextbyte) == 0:
-            raise BufferError("Reached end of stream")
-        bytecount += 1
-        # Take the low word and shift it high; Use OR to add this byte
-        nextint = ord(nextbyte)
-        if DEBUG: print('0x{byte:02X} {byte:08b}'.format(byte=nextint))
-        headerword = ((headerword & 0x00FF) << 8) | nextint
-
-        if 0 < maximum_bytes <= bytecount:
-            raise BufferError("Failed to detect header word in serial stream")
-
-    try:
-        h = MTS.Header.Header(word=headerword)
-        if DEBUG: print("Found header word. 0x{:04X}".format(h.word))
-        return h
-    except ValueError as e:
-        print("Invalid header word 0x{:04X}".format(headerword))
-        raise e
-
-
-def read_packets(serial_input):
-    """
-    Consume bytes from input, creating packet frames of words
-    :rtype: MTS.Packet.Packet
-    :type serial_input:
-    """
-    while 1:
-        header = scan_to_headerword(serial_input)
-        yield header.read_packet(serial_input)
-
-
-def live_stream(tty='cu.UC-232AC'):
-    import serial
-    from serial import SerialException
-    try:
-        return serial.Serial('/dev/{}'.format(tty), 19200)
-    except SerialException as e:
-        _log.warn("Failed to open port: %s", e)
-    return None
-
-
 elapsed_millis = 0
 previous_send_time = time.time()
 send_count = 0
@@ -98,6 +40,7 @@ packet = None
 send_byte_buffer = None
 start_time = None
 input_stream = None
+input_packets = None
 
 
 def send_packet():
@@ -105,7 +48,7 @@ def send_packet():
         send_byte_buffer, \
         send_count, \
         elapsed_millis, \
-        input_stream, output_stream, \
+        input_stream, input_packets, output_stream, \
         previous_send_time, start_time
     now = time.time()
     delta = (now - previous_send_time) * 1000.0
@@ -125,9 +68,9 @@ def send_packet():
                     packet
             ))
 
-    packet = read_packets(input_stream).next()
+    packet = next(input_packets)
     words = packet.words()
-    send_byte_buffer = ''.join([struct.pack('>H', h) for h in words])
+    send_byte_buffer = b''.join([struct.pack('>H', h) for h in words])
 
 
 # Debug a chunk; Compare to HexFiend to confirm serial read
@@ -145,15 +88,12 @@ _log = logging.getLogger('replay')
 
 
 def open_input(path=None):
-    global input_stream
+    global input_stream, input_packets
     # Open input stream
     input_file = path if path is not None else 'data/openlog-20160710-001.TXT'
     print(_t.bold('Reading from: {}'.format(input_file)))
-    input_stream = io.open(
-        input_file,
-        mode='rb',
-        buffering=io.DEFAULT_BUFFER_SIZE
-    )
+    input_stream = captured_stream(input_file)
+    input_packets = read_packets(input_stream)
     return input_stream
 
 
@@ -166,7 +106,8 @@ def add_sender():
         scheduler.start()
 
 
-if __name__ == '__main__':
+def main(input_path=None, tty='cu.UC-232AC'):
+    global scheduler, sendjob, output_stream
     logging.basicConfig()
 
     d = Display(_t)
@@ -183,7 +124,8 @@ if __name__ == '__main__':
 
     # open_input(path='data/openlog-20160807-002.TXT')  # return from Wilder Ranch
     # open_input(path='data/openlog-20160807-001.TXT')  # return from Wilder Ranch
-    output_stream = live_stream()
+    open_input(path=input_path if input_path is not None else _s.get('input_file'))
+    output_stream = live_stream(tty)
 
     # Install input handlers (callbacks for commands)
     d.add_command('send', add_sender)
@@ -200,3 +142,7 @@ if __name__ == '__main__':
 
     # Start the display
     d.start()
+
+
+if __name__ == '__main__':
+    main()
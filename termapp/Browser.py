@@ -0,0 +1,150 @@
+"""
+Scroll through a capture of any size in the terminal.
+
+Only the rows on screen are read and decoded, each by seeking straight to its frame
+through the capture's frame index (or block index), so opening and paging cost the same
+for a 10 KB log as for a 100 MB one.
+
+    PgUp / PgDn, Up / Down, Home / End     scroll
+    <digits> g      go to packet            > goto <packet>
+    <digits> t      go to time (seconds)    > time <seconds>
+    F1              quit
+"""
+from __future__ import print_function, division
+import io
+
+from blessed import Terminal
+from blessed.keyboard import Keystroke
+
+from MTS.BlockStore import BlockReader, is_block_file
+from MTS.FrameIndex import FrameIndex
+from MTS.Packet import format_packet
+from MTS.Timing import PacketClock, timestamps_for
+from MTS.stream import decode_frame
+from termapp.Display import Display
+
+
+class Browser(object):
+
+    def __init__(self, display, terminal, path):
+        """
+        :type display: termapp.Display.Display
+        """
+        super(Browser, self).__init__()
+        self._d = display
+        self._t = terminal
+        self.path = path
+        self._stream = io.open(path, mode='rb')
+        if is_block_file(self._stream.read(8)):
+            self._blocks = BlockReader(self._stream)
+            self._index = None
+            self.count = len(self._blocks)
+        else:
+            self._blocks = None
+            self._index = FrameIndex.for_file(path)
+            self.count = len(self._index)
+        self._clock = PacketClock(timestamps_for(path, self.count))
+        self.top = 0
+        self.message = u''
+
+        display.add_widget(self.render)
+        t = terminal
+        for code, name, callback in (
+                (t.KEY_PGDOWN, 'KEY_PGDOWN', lambda: self.scroll(self.rows())),
+                (t.KEY_PGUP, 'KEY_PGUP', lambda: self.scroll(-self.rows())),
+                (t.KEY_DOWN, 'KEY_DOWN', lambda: self.scroll(1)),
+                (t.KEY_UP, 'KEY_UP', lambda: self.scroll(-1)),
+                (t.KEY_HOME, 'KEY_HOME', lambda: self.goto(0)),
+                (t.KEY_END, 'KEY_END', lambda: self.goto(self.count - 1)),
+        ):
+            display.add_key(Keystroke(ucs=u'', code=code, name=name), callback)
+        display.add_key(Keystroke(ucs=u'g'), lambda: self.goto_text(display.take_digits()))
+        display.add_key(Keystroke(ucs=u't'), lambda: self.time_text(display.take_digits()))
+        display.add_command('goto', self.goto_text)
+        display.add_command('time', self.time_text)
+
+    def close(self):
+        self._stream.close()
+
+    def rows(self):
+        # Inside the border, below the title line and above the status bar
+        return max(1, self._t.height - 5)
+
+    # Navigation
+
+    def scroll(self, rows):
+        self.goto(self.top + rows)
+
+    def goto(self, packet_number):
+        self.top = min(max(packet_number, 0), max(self.count - self.rows(), 0))
+        self._d.redraw()
+
+    def goto_time(self, seconds):
+        self.goto(self.packet_at_time(seconds * 1000.0))
+
+    def goto_text(self, text):
+        self.message = u''
+        try:
+            self.goto(int(text))
+        except ValueError:
+            self.message = u'Not a packet number: {}'.format(text)
+            self._d.redraw()
+
+    def time_text(self, text):
+        self.message = u''
+        try:
+            self.goto_time(float(text))
+        except ValueError:
+            self.message = u'Not a time in seconds: {}'.format(text)
+            self._d.redraw()
+
+    # Packets
+
+    def time_of(self, packet_number):
+        """
+        :return: ms since the first packet
+        """
+        return self._clock.time_of(packet_number)
+
+    def packet_at_time(self, ms):
+        return self._clock.packet_at_time(ms)
+
+    def frame(self, packet_number):
+        if self._blocks is not None:
+            return self._blocks.frame(packet_number)
+        return self._index.read_frame(self._stream, packet_number)
+
+    def line(self, packet_number):
+        try:
+            text = format_packet(packet_number, decode_frame(self.frame(packet_number)))
+        except (ValueError, IndexError, BufferError) as e:
+            text = u'{: 5d} <{}>'.format(packet_number, e)
+        return u'{:9.2f}s {}'.format(self.time_of(packet_number) / 1000, text)
+
+    def render(self):
+        t = self._t
+        width = t.width - 3
+        rows = self.rows()
+        last = min(self.top + rows, self.count) - 1
+        title = u'{}  packets {:d}-{:d} of {:d}  {}'.format(self.path, self.top, last, self.count, self.message)
+        out = [t.move(1, 1) + t.reverse(title[:width].ljust(width))]
+        for row in range(rows):
+            n = self.top + row
+            text = self.line(n) if n < self.count else u''
+            out.append(t.move(2 + row, 1) + text[:width].ljust(width))
+        self._d.echo(u''.join(out))
+
+
+def main(path):
+    t = Terminal(force_styling=True)
+    display = Display(t, title='Browse')
+    browser = Browser(display, t, path)
+    try:
+        display.start()
+    finally:
+        browser.close()
+
+
+if __name__ == '__main__':
+    import sys
+    main(sys.argv[1])
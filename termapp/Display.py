@@ -1,13 +1,12 @@
 import signal
 
-from blessed import Terminal
-
 from termapp.Box import BoxStyle
 
 
 class Display():
-    def __init__(self, terminal):
+    def __init__(self, terminal, title='Replay'):
         self._t = terminal
+        self._title = title
         self._keyhandlers = {}
         self._widgets = []
         self._digit_buffer = u''
@@ -19,11 +18,30 @@ class Display():
         self._boxes = {}
 
     def add_command(self, command, callback):
+        """
+        callback() for '> command'; callback(argument) for '> command argument'
+        """
         self._commands[command] = callback
 
     def add_key(self, inputkey, callback):
         self._keyhandlers[repr(inputkey)] = callback
 
+    def add_widget(self, render):
+        """
+        render() is called after the status bar on every redraw
+        """
+        self._widgets.append(render)
+
+    def redraw(self):
+        self._redraw = True
+
+    def take_digits(self):
+        """
+        :return: digits typed since the last call, and clear them
+        """
+        digits, self._digit_buffer = self._digit_buffer, u''
+        return digits
+
     def echo(self, text):
         self._t.stream.write(u'{}'.format(text))
         self._t.stream.flush()
@@ -31,18 +49,20 @@ class Display():
     def on_resize(self, *args):
         # Get new geometery
         self.echo(self._t.clear)
-        with self._t.location(y=4, x=-10 + (self._t.width / 2)):
+        with self._t.location(y=4, x=-10 + (self._t.width // 2)):
             self.echo('height={t.height}, width={t.width}\r'.format(t=self._t))
         self._redraw = True
 
     def start(self):
         with self._t.hidden_cursor(), self._t.cbreak(), self._t.fullscreen():
             self._t.location(y=2)
-            self.echo(self._t.center(self._t.bold('Replay')))
+            self.echo(self._t.center(self._t.bold(self._title)))
             self._redraw = True
             while True:
                 if self._redraw:
                     self.status()
+                    for render in self._widgets:
+                        render()
                     self._redraw = False
                 terminal_input = self._t.inkey(timeout=2)
 
@@ -65,10 +85,9 @@ class Display():
                 if terminal_input == '>':
                     with self._t.location(20, 5):
                         self.echo('type command + enter; esc to cancel ')
-                        cmd = self.readline(self._t)
-                    self.echo(cmd)
-                    if cmd in self._commands:
-                        self._commands[cmd]()
+                        cmd = self.readline()
+                    self.run_command(cmd)
+                    self._redraw = True
 
                 if terminal_input == 'c':
                     for bg in range(self._t.number_of_colors):
@@ -86,6 +105,20 @@ class Display():
                 if ord('0') <= char <= ord('9'):
                     self.accumulate_digit(terminal_input)
 
+    def run_command(self, cmd):
+        """
+        Dispatch a line read after '>'; None (cancelled) or an unknown command does nothing
+        """
+        if not cmd:
+            return
+        self.echo(cmd)
+        if cmd in self._commands:
+            self._commands[cmd]()
+            return
+        name, _, argument = cmd.partition(' ')
+        if name in self._commands:
+            self._commands[name](argument.strip())
+
     def status(self):
         # Render a simple status bar
         with self._t.location(0, self._t.height - 1):
@@ -127,7 +160,11 @@ class Display():
             self.echo(self._t.normal)
 
     def readline(self, width=20):
-        """A rudimentary readline implementation."""
+        """
+        A rudimentary readline implementation.
+        :param width: most characters accepted
+        :return: the line, or None when cancelled
+        """
         text = u''
         self.echo('> ')
         while True:
@@ -143,7 +180,7 @@ class Display():
             elif inp.code in (self._t.KEY_BACKSPACE, self._t.KEY_DELETE):
                 text = text[:-1]
                 self.echo(u'\b \b')
-        width = len(text) + 2
+        width = len(text or u'') + 2
         self.echo(u'\b' * width)
         self.echo(u' ' * width)
         return text
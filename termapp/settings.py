@@ -1,10 +1,18 @@
-import collections
 import io
 import logging
-import ujson
 
+try:
+    import ujson as json
+except ImportError:
+    import json
 
-class Settings(collections.MutableMapping):
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+class Settings(MutableMapping):
     def __init__(self, *args, **kwargs):
         self._logger = logging.getLogger('Settings')
         self.store = dict()
@@ -34,10 +42,10 @@ class Settings(collections.MutableMapping):
                 mode='rb',
                 buffering=io.DEFAULT_BUFFER_SIZE
             )
-            self.update(ujson.load(js))
-            self._logger.info('Loaded from {}', path)
+            self.update(json.load(js))
+            self._logger.info('Loaded from %s', path)
         except IOError as e:
-            self._logger.warn('Failed to open path={}; {}', path, e.message)
+            self._logger.warning('Failed to open path=%s; %s', path, e)
 
     def save(self, path=None):
         if path is None:
@@ -46,6 +54,6 @@ class Settings(collections.MutableMapping):
             else:
                 raise KeyError('path must be specified')
         js = io.open(path, mode='w', encoding='UTF-8')
-        ujson.dump(self, js)
+        json.dump(dict(self), js)
         js.flush()
         js.close()
\ No newline at end of file
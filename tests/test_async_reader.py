@@ -0,0 +1,87 @@
+from __future__ import print_function, division
+import os
+import socket
+import struct
+import unittest
+
+try:
+    import asyncio
+    import pty
+    from MTS.AsyncReader import AsyncReader
+except ImportError:
+    AsyncReader = None
+
+
+def frame(n):
+    return struct.pack('>3H', 0xB282, n & 0x7F, (n >> 7) & 0x7F)
+
+
+@unittest.skipIf(AsyncReader is None, 'needs Python 3.7 or later')
+class AsyncReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pairs = {source: socket.socketpair() for source in ('lc2', 'ssi4')}
+        self.reader = AsyncReader({source: ours.fileno() for source, (ours, _) in self.pairs.items()})
+        self.wait(self.reader.__aenter__())
+
+    def tearDown(self):
+        self.reader.close()
+        for pair in self.pairs.values():
+            for end in pair:
+                end.close()
+        self.loop.close()
+
+    def wait(self, awaitable, timeout=2.0):
+        return self.loop.run_until_complete(asyncio.wait_for(awaitable, timeout))
+
+    def next(self):
+        return self.wait(self.reader.__anext__())
+
+    def send(self, source, data):
+        self.pairs[source][1].sendall(data)
+
+    def test_frames_are_tagged_with_their_source(self):
+        self.send('lc2', frame(1) + frame(2)[:3])
+        self.assertEqual(self.next()[::2], ('lc2', frame(1)))
+        self.send('ssi4', frame(3))
+        self.send('lc2', frame(2)[3:])
+        received = [self.next(), self.next()]
+        self.assertEqual(sorted(item[::2] for item in received), [('lc2', frame(2)), ('ssi4', frame(3))])
+        self.assertEqual(self.reader.frames, {'lc2': 2, 'ssi4': 1})
+
+    def test_ends_when_every_source_closes(self):
+        self.send('ssi4', frame(1))
+        for _, theirs in self.pairs.values():
+            theirs.shutdown(socket.SHUT_WR)
+        self.assertEqual(self.next().frame, frame(1))
+        self.assertRaises(StopAsyncIteration, self.next)
+        self.assertRaises(StopAsyncIteration, self.next)
+
+    def test_close_wakes_a_waiting_reader(self):
+        self.loop.call_later(0.05, self.reader.close)
+        self.assertRaises(StopAsyncIteration, self.next)
+
+
+@unittest.skipIf(AsyncReader is None, 'needs Python 3.7 or later')
+class PseudoTerminalTest(unittest.TestCase):
+
+    def test_reads_a_device_path(self):
+        master, slave = pty.openpty()
+        loop = asyncio.new_event_loop()
+        try:
+            reader = AsyncReader({'lc2': os.ttyname(slave)})
+            loop.run_until_complete(reader.__aenter__())
+            os.write(master, frame(7) + frame(8))
+            received = [loop.run_until_complete(asyncio.wait_for(reader.__anext__(), 2.0)) for _ in range(2)]
+            self.assertEqual([item.frame for item in received], [frame(7), frame(8)])
+            self.assertLessEqual(received[0].received, received[1].received)
+            reader.close()
+        finally:
+            loop.close()
+            os.close(master)
+            os.close(slave)
+
+
+if __name__ == '__main__':
+    unittest.main()
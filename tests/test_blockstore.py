@@ -0,0 +1,81 @@
+from __future__ import print_function, division
+import io
+import os
+import struct
+import unittest
+
+from MTS.BlockStore import BlockReader, BlockStream, BlockWriter
+from MTS.stream import read_frames, read_gaps_and_frames
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'data')
+
+
+def frame(n):
+    # Data header, 2 words: two aux channels carrying n
+    return struct.pack('>3H', 0xB282, n & 0x007F, (n >> 7) & 0x007F)
+
+
+def write_blocks(data, **kwargs):
+    out = io.BytesIO()
+    with BlockWriter(out, **kwargs) as writer:
+        for gap, raw_frame in read_gaps_and_frames(io.BytesIO(data)):
+            writer.write_gap(gap)
+            if raw_frame is not None:
+                writer.write(raw_frame)
+    return out.getvalue(), writer
+
+
+class TruncatedTest(unittest.TestCase):
+
+    def test_recovers_whole_blocks_only(self):
+        frames = [frame(n // 3) for n in range(40)]
+        data, _ = write_blocks(b''.join(frames), frames_per_block=8)
+        for cut in range(len(data) + 1):
+            try:
+                reader = BlockReader(io.BytesIO(data[:cut]))
+            except struct.error:
+                # Not even a file header
+                self.assertLess(cut, 12)
+                continue
+            self.assertIn(len(reader), (0, 8, 16, 24, 32, 40))
+            self.assertEqual(list(reader.frames()), frames[:len(reader)])
+        self.assertEqual(len(BlockReader(io.BytesIO(data))), 40)
+
+
+class LosslessTest(unittest.TestCase):
+
+    def assertRoundTrip(self, data, **kwargs):
+        stored, writer = write_blocks(data, **kwargs)
+        frames = list(read_frames(io.BytesIO(data)))
+        self.assertEqual(writer.packets, len(frames))
+        self.assertEqual(writer.gap_bytes, len(data) - len(b''.join(frames)))
+        self.assertEqual(io.BufferedReader(BlockStream(io.BytesIO(stored))).read(), data)
+        reader = BlockReader(io.BytesIO(stored))
+        self.assertEqual(list(reader.frames()), frames)
+        return reader
+
+    def test_noise_and_trailing_partial(self):
+        frames = [frame(n // 4) for n in range(30)]
+        data = b'\x00\x01' + frames[0] + b'\xA2' + b''.join(frames[1:20]) + b'\x55\xAA\x55' + \
+            b''.join(frames[20:]) + frames[0][:3]
+        for kwargs in ({}, {'dedup': True}, {'frames_per_block': 4}, {'dedup': True, 'frames_per_block': 2}):
+            self.assertRoundTrip(data, **kwargs)
+
+    def test_noisy_capture(self):
+        with io.open(os.path.join(DATA, 'LOG00129.TXT'), mode='rb') as instream:
+            data = instream.read()
+        for kwargs in ({'frames_per_block': 16}, {'dedup': True, 'frames_per_block': 4}):
+            self.assertRoundTrip(data, **kwargs)
+
+    def test_seek_past_gaps(self):
+        frames = [frame(n) for n in range(10)]
+        data = b''.join(b'\x00' * (n % 3) + f for n, f in enumerate(frames))
+        stored, _ = write_blocks(data, frames_per_block=4)
+        for n in range(10):
+            stream = BlockStream(io.BytesIO(stored))
+            stream.seek_packet(n)
+            self.assertEqual(io.BufferedReader(stream).read(), data[data.index(frames[n]):])
+
+
+if __name__ == '__main__':
+    unittest.main()
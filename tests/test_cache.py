@@ -0,0 +1,66 @@
+from __future__ import print_function, division
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from MTS.Cache import DecodeCache
+
+
+def frame(n):
+    # Data header, 2 words: two aux channels carrying n
+    return struct.pack('>3H', 0xB282, n & 0x007F, (n >> 7) & 0x007F)
+
+
+class DecodeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.ISP2')
+        self.write(range(5))
+        self.cache = DecodeCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, numbers):
+        with io.open(self.path, mode='wb') as out:
+            out.write(b''.join(frame(n) for n in numbers))
+
+    def test_second_decode_hits(self):
+        first = self.cache.load(self.path)
+        second = self.cache.load(self.path)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(list(second.aux[0]), list(first.aux[0]))
+        self.assertEqual(list(second.aux[0]), [0, 1, 2, 3, 4])
+
+    def test_edit_misses(self):
+        self.cache.load(self.path)
+        self.write(range(10, 16))
+        columns = self.cache.load(self.path)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.assertEqual(list(columns.aux[0]), [10, 11, 12, 13, 14, 15])
+
+    def test_least_recently_used_evicted(self):
+        self.cache.load(self.path)
+        (_, size, old), = self.cache.entries()
+        os.utime(old, (1, 1))
+        self.cache.max_bytes = size
+        self.write(range(5, 10))
+        self.cache.load(self.path)
+        (_, _, kept), = self.cache.entries()
+        self.assertNotEqual(kept, old)
+
+    def test_damaged_entry_misses(self):
+        self.cache.load(self.path)
+        _, _, entry = self.cache.entries()[0]
+        with io.open(entry, mode='wb') as out:
+            out.write(b'not columns')
+        self.assertEqual(len(self.cache.load(self.path)), 5)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+from __future__ import print_function, division
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from MTS.Calibration import RAW, Calibration, Calibrations, linear, load_calibrations, piecewise, polynomial
+from MTS.Columns import Columns
+from MTS.Packet import AuxBits
+from MTS.Query import Query
+from MTS.stream import decode_frame
+
+SETTINGS = {
+    'calibrations': {
+        'aux1': {'name': 'map', 'units': 'kPa', 'linear': {'scale': 50.0, 'offset': -20.0}},
+        'aux2': {'name': 'oil', 'units': 'psi', 'polynomial': [-12.5, 25.0, 0.4]},
+        'aux3': {'name': 'egt', 'units': 'C', 'input': 'raw', 'table': [[0, 0], [1023, 1250]]},
+    }
+}
+
+
+def volts(raw):
+    return raw * AuxBits.MAX_VOLTS / AuxBits.MAX_VALUE
+
+
+def frame(*aux_values):
+    # Data header with aux words only
+    words = [((v >> 7) << 8) | (v & 0x7F) for v in aux_values]
+    return struct.pack('>{:d}H'.format(len(words) + 1), 0xB280 | len(words), *words)
+
+
+def with_calibration(key, spec):
+    return {'calibrations': {key: spec}}
+
+
+class CurveTest(unittest.TestCase):
+
+    def test_linear_over_volts(self):
+        calibration = Calibration(linear(50.0, -20.0))
+        self.assertEqual(len(calibration.table), 1024)
+        self.assertAlmostEqual(calibration(0), -20.0)
+        self.assertAlmostEqual(calibration(1023), 230.0)
+        self.assertAlmostEqual(calibration(512), volts(512) * 50.0 - 20.0)
+
+    def test_raw_input(self):
+        calibration = Calibration(linear(2.0), source=RAW)
+        self.assertEqual(calibration(100), 200.0)
+
+    def test_polynomial_constant_first(self):
+        self.assertEqual(polynomial([1.0, 2.0, 3.0])(2.0), 1.0 + 4.0 + 12.0)
+        self.assertRaises(ValueError, polynomial, [])
+
+    def test_table_interpolates_and_holds_its_ends(self):
+        curve = piecewise([(5.0, 1250), (0.0, 0), (1.25, 250)])
+        self.assertEqual([curve(x) for x in (-1.0, 0.625, 1.25, 3.125, 9.0)], [0.0, 125.0, 250.0, 750.0, 1250.0])
+        self.assertRaises(ValueError, piecewise, [(1.0, 2.0)])
+        self.assertRaises(ValueError, piecewise, [(1.0, 2.0), (1.0, 3.0)])
+
+    def test_unknown_input(self):
+        self.assertRaises(ValueError, Calibration, linear(), source='amps')
+
+
+class SettingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_channels_are_zero_based(self):
+        calibrations = Calibrations.from_settings(SETTINGS)
+        self.assertEqual([(channel, c.name, c.units) for channel, c in calibrations.items()],
+                         [(0, 'map', 'kPa'), (1, 'oil', 'psi'), (2, 'egt', 'C')])
+        self.assertEqual(calibrations.by_name('egt')[0], 2)
+        self.assertIsNone(calibrations.by_name('boost'))
+        self.assertEqual(calibrations[2](1023), 1250.0)
+        self.assertAlmostEqual(calibrations[1](0), -12.5)
+
+    def test_name_defaults_to_the_channel(self):
+        calibrations = Calibrations.from_settings(with_calibration('aux4', {'linear': {}}))
+        self.assertEqual(calibrations[3].name, 'aux4')
+
+    def test_load_from_file(self):
+        path = os.path.join(self.directory, 'settings.json')
+        with io.open(path, mode='wb') as out:
+            out.write(json.dumps(SETTINGS).encode('ascii'))
+        self.assertEqual(len(load_calibrations(path)), 3)
+        self.assertEqual(len(load_calibrations(os.path.join(self.directory, 'missing.json'))), 0)
+
+    def test_bad_entries(self):
+        for settings in (
+            with_calibration('aux0', {'linear': {}}),
+            with_calibration('oil', {'linear': {}}),
+            with_calibration('aux1', {}),
+            with_calibration('aux1', {'linear': {}, 'polynomial': [1.0]}),
+            {'calibrations': {'aux1': {'name': 'p', 'linear': {}}, 'aux2': {'name': 'p', 'linear': {}}}},
+        ):
+            self.assertRaises(ValueError, Calibrations.from_settings, settings)
+
+    def test_names_clashing_with_queries(self):
+        for name in ('and', 'not', 'None', 'True', 'afr', 'time', 'function', 'aux2', 'oil pressure', '2nd', ''):
+            self.assertRaises(ValueError, Calibrations.from_settings,
+                              with_calibration('aux1', {'name': name, 'linear': {}}))
+        # A channel may keep its own auxN name
+        self.assertEqual(Calibrations.from_settings(with_calibration('aux1', {'name': 'aux1', 'linear': {}}))[0].name,
+                         'aux1')
+
+    def test_query_by_name(self):
+        columns = Columns()
+        columns.extend([frame(0, 0), frame(1023, 0), frame(512)])
+        calibrations = Calibrations.from_settings(SETTINGS)
+        self.assertEqual(Query('map > 100', calibrations).ranges(columns), [(1, 3)])
+        self.assertEqual(Query('aux1.cal > 100', calibrations).ranges(columns), [(1, 3)])
+        self.assertEqual(Query('oil == None', calibrations).ranges(columns), [(2, 3)])
+
+    def test_packet_values(self):
+        calibrations = Calibrations.from_settings(SETTINGS)
+        values = calibrations.values(decode_frame(frame(1023, 0)))
+        self.assertEqual(sorted(values), ['map', 'oil'])
+        self.assertAlmostEqual(values['map'], 230.0)
+        self.assertAlmostEqual(values['oil'], -12.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+from __future__ import print_function, division
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from MTS.Capture import BLOCK, DROP_NEWEST, DROP_OLDEST, CapturePipeline, Sink
+
+# Data header, 2 words: 6 bytes
+FRAME = struct.pack('>3H', 0xB282, 0x0012, 0x0034)
+
+
+class ListSink(Sink):
+    """
+    Records packet numbers; handling waits for gate when one is given
+    """
+
+    def __init__(self, gate=None, **kwargs):
+        super(ListSink, self).__init__('list', **kwargs)
+        self.gate = gate
+        self.indexes = []
+
+    def handle(self, index, received, frame):
+        if self.gate is not None:
+            self.gate.wait()
+        self.indexes.append(index)
+
+
+def offer(sink, count):
+    for index in range(count):
+        sink.offer((index, 0, FRAME))
+
+
+class PolicyTest(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        sink = ListSink(maxsize=2, policy=DROP_OLDEST)
+        offer(sink, 5)
+        self.assertEqual(sink.stats().queued, 2)
+        sink.start()
+        sink.stop(1.0)
+        self.assertEqual(sink.indexes, [3, 4])
+        self.assertEqual((sink.received, sink.dropped, sink.processed), (5, 3, 2))
+
+    def test_drop_newest(self):
+        sink = ListSink(maxsize=2, policy=DROP_NEWEST)
+        offer(sink, 5)
+        self.assertEqual(sink.stats().queued, 2)
+        sink.start()
+        sink.stop(1.0)
+        self.assertEqual(sink.indexes, [0, 1])
+        self.assertEqual((sink.received, sink.dropped, sink.processed), (5, 3, 2))
+
+    def test_block_waits_for_room(self):
+        gate = threading.Event()
+        sink = ListSink(gate=gate, maxsize=1, policy=BLOCK)
+        sink.start()
+        reader = threading.Thread(target=offer, args=(sink, 4))
+        reader.start()
+        reader.join(0.2)
+        # One frame in handle(), one queued, the reader waiting with the third
+        self.assertTrue(reader.is_alive())
+        self.assertLessEqual(sink.stats().queued, 1)
+        gate.set()
+        reader.join(1.0)
+        sink.stop(1.0)
+        self.assertEqual(sink.indexes, [0, 1, 2, 3])
+        self.assertEqual(sink.dropped, 0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            ListSink(policy='drop-all')
+
+
+class IdleInput(object):
+    """
+    Non-blocking input with nothing to read
+    """
+
+    def __init__(self):
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        return b''
+
+
+class SocketPort(object):
+    """
+    A serial port lookalike over a socket, opened without a read timeout
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    @property
+    def in_waiting(self):
+        self._sock.setblocking(False)
+        try:
+            return len(self._sock.recv(4096, socket.MSG_PEEK))
+        except socket.error:
+            return 0
+        finally:
+            self._sock.setblocking(True)
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def read(self, size):
+        return self._sock.recv(size)
+
+
+class LiveStopTest(unittest.TestCase):
+
+    def stop_within(self, pipeline, seconds):
+        started = time.time()
+        stopper = threading.Thread(target=pipeline.stop)
+        stopper.daemon = True
+        stopper.start()
+        stopper.join(seconds)
+        self.assertFalse(stopper.is_alive())
+        return time.time() - started
+
+    def test_idle_line_does_not_spin(self):
+        source = IdleInput()
+        pipeline = CapturePipeline(source, live=True, poll=0.05)
+        pipeline.start()
+        time.sleep(0.3)
+        self.stop_within(pipeline, 1.0)
+        self.assertLess(source.reads, 20)
+
+    def test_stop_while_waiting_on_a_port(self):
+        local, remote = socket.socketpair()
+        try:
+            sink = ListSink()
+            pipeline = CapturePipeline(SocketPort(local), sinks=[sink], live=True, poll=0.05)
+            pipeline.start()
+            remote.sendall(FRAME * 2)
+            deadline = time.time() + 1.0
+            while len(sink.indexes) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(sink.indexes, [0, 1])
+            self.assertLess(self.stop_within(pipeline, 2.0), 1.0)
+        finally:
+            local.close()
+            remote.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
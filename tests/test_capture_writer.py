@@ -0,0 +1,112 @@
+from __future__ import print_function, division
+import io
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+
+from MTS.CaptureWriter import CaptureWriter
+from MTS.Timing import load_timestamps, sidecar_path
+
+# Data header, 2 words: 6 bytes
+FRAME = struct.pack('>3H', 0xB282, 0x0012, 0x0034)
+
+
+class Clock(object):
+    """
+    Seconds that only move when told to
+    """
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CaptureWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = Clock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writer(self, **kwargs):
+        kwargs.setdefault('max_delay', None)
+        return CaptureWriter(directory=self.directory, clock=self.clock, **kwargs)
+
+    def contents(self, path):
+        with io.open(path, mode='rb') as instream:
+            return instream.read()
+
+    def test_batch_size_flush(self):
+        with self.writer(batch_bytes=2 * len(FRAME)) as writer:
+            writer.write(FRAME)
+            self.assertEqual(os.path.getsize(writer.path), 0)
+            writer.write(FRAME)
+            self.assertEqual(self.contents(writer.path), FRAME * 2)
+
+    def test_delay_flush_on_write(self):
+        with self.writer(max_delay=5.0) as writer:
+            writer.write(FRAME)
+            self.clock.now += 4.0
+            writer.write(FRAME)
+            self.assertEqual(os.path.getsize(writer.path), 0)
+            self.clock.now += 1.0
+            writer.write(FRAME)
+            self.assertEqual(self.contents(writer.path), FRAME * 3)
+
+    def test_delay_flush_on_timer(self):
+        with CaptureWriter(directory=self.directory, max_delay=0.05) as writer:
+            writer.write(FRAME)
+            deadline = time.time() + 2.0
+            while os.path.getsize(writer.path) == 0 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.contents(writer.path), FRAME)
+
+    def test_no_delay(self):
+        # max_delay=None: batches only go out by size
+        with self.writer() as writer:
+            writer.write(FRAME)
+            self.clock.now += 3600.0
+            writer.write(FRAME)
+            self.assertEqual(os.path.getsize(writer.path), 0)
+
+    def test_rotate_by_size(self):
+        with self.writer(batch_bytes=1, max_bytes=2 * len(FRAME)) as writer:
+            for _ in range(5):
+                writer.write(FRAME)
+        self.assertEqual([self.contents(path) for path in writer.paths], [FRAME * 2, FRAME * 2, FRAME])
+
+    def test_rotate_by_age(self):
+        with self.writer(max_seconds=60) as writer:
+            writer.write(FRAME)
+            self.clock.now += 59.0
+            writer.write(FRAME)
+            self.clock.now += 1.0
+            writer.write(FRAME)
+        self.assertEqual([self.contents(path) for path in writer.paths], [FRAME * 2, FRAME])
+        self.assertEqual(len(set(writer.paths)), 2)
+
+    def test_close_drains_the_batch(self):
+        writer = self.writer()
+        for _ in range(3):
+            writer.write(FRAME)
+        self.assertEqual(os.path.getsize(writer.path), 0)
+        writer.close()
+        self.assertEqual(self.contents(writer.path), FRAME * 3)
+
+    def test_timestamps_follow_rotation(self):
+        with self.writer(max_bytes=2 * len(FRAME), timestamps=True) as writer:
+            for n in range(3):
+                writer.write(FRAME, received=n * 1000)
+        self.assertEqual([list(load_timestamps(sidecar_path(path))) for path in writer.paths],
+                         [[0, 1000], [2000]])
+
+
+if __name__ == '__main__':
+    unittest.main()
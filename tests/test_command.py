@@ -0,0 +1,165 @@
+from __future__ import print_function, division
+import io
+import itertools
+import os
+import struct
+import threading
+import time
+import unittest
+
+from MTS.Capture import Sink
+from MTS.Command import (
+    CALIBRATE, NAMELIST, SYNCHRONIZE, TYPELIST, ChannelClosed, CommandChannel, CommandTimeout, is_response,
+    listen, response_command, response_frame
+)
+from MTS.FakeDevice import FakeDevice
+from MTS.stream import FrameParser
+
+CAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'cap')
+
+# Data header, 2 aux words
+DATA_FRAME = struct.pack('>3H', 0xB282, 0x0012, 0x0034)
+
+
+def capture(name):
+    with io.open(os.path.join(CAP, name), mode='rb') as instream:
+        return instream.read()
+
+
+class CollectSink(Sink):
+
+    def __init__(self):
+        super(CollectSink, self).__init__('collect', maxsize=0)
+        self.frames = []
+        self.arrived = threading.Event()
+
+    def handle(self, index, received, frame):
+        self.frames.append(frame)
+        self.arrived.set()
+
+
+class ResponseFrameTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for command in (ord(NAMELIST), ord(TYPELIST), 0x3FFF):
+            frame = response_frame(command, b'ABC')
+            self.assertTrue(is_response(frame))
+            self.assertEqual(response_command(frame), command)
+            self.assertEqual(FrameParser().feed(frame), [frame])
+            self.assertEqual(frame[4:], b'ABC\x00')
+
+
+class CommandChannelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = FakeDevice.from_cap(CAP, frames=itertools.repeat(DATA_FRAME), interval=1.0, timeout=0.02)
+        self.sink = CollectSink()
+        self.channel = CommandChannel(self.device, sinks=[self.sink])
+        self.channel.start()
+        self.assertTrue(self.sink.arrived.wait(1.0))
+
+    def tearDown(self):
+        self.channel.stop(1.0)
+        self.device.close()
+
+    def test_namelist(self):
+        response = self.channel.send(NAMELIST).result(timeout=1.0)
+        self.assertEqual(response.command, ord(NAMELIST))
+        self.assertEqual(response.data, capture('0x6E.txt'))
+
+    def test_typelist(self):
+        type_record = capture('S.txt')
+        data = self.channel.send(TYPELIST).result(timeout=1.0).data
+        self.assertEqual(data[:len(type_record)], type_record)
+
+    def test_pipelined_requests_answered_in_order(self):
+        requests = [self.channel.send(NAMELIST), self.channel.send(*listen_command('ROBWILLS')),
+                    self.channel.send(NAMELIST)]
+        responses = [request.result(timeout=1.0) for request in requests]
+        self.assertEqual([r.data for r in responses], [capture('0x6E.txt'), b'', capture('0x6E.txt')])
+        self.assertEqual(self.device.written[1], listen('ROBWILLS'))
+
+    def test_command_without_response(self):
+        self.assertIsNone(self.channel.send(SYNCHRONIZE).result(timeout=1.0))
+
+    def test_data_keeps_flowing(self):
+        before = len(self.sink.frames)
+        for _ in range(5):
+            self.channel.send(NAMELIST).result(timeout=1.0)
+        deadline = time.time() + 1.0
+        while len(self.sink.frames) <= before and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreater(len(self.sink.frames), before)
+        self.assertEqual(set(self.sink.frames), {DATA_FRAME})
+        self.assertEqual(self.channel.responses, 5)
+
+    def test_timeout(self):
+        self.device.responses.pop(ord(NAMELIST))
+        with self.assertRaises(CommandTimeout):
+            self.channel.send(NAMELIST).result(timeout=0.1)
+
+
+class StuckDevice(FakeDevice):
+    """
+    write() blocks until released
+    """
+
+    def __init__(self, **kwargs):
+        super(StuckDevice, self).__init__(**kwargs)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.writing.set()
+        self.release.wait(5.0)
+        return super(StuckDevice, self).write(data)
+
+
+class StopTest(unittest.TestCase):
+
+    def test_unwritten_requests_fail_on_stop(self):
+        device = StuckDevice(frames=itertools.repeat(DATA_FRAME), interval=1.0, timeout=0.02)
+        channel = CommandChannel(device)
+        channel.start()
+        try:
+            requests = [channel.send(NAMELIST), channel.send(SYNCHRONIZE), channel.send(NAMELIST)]
+            self.assertTrue(device.writing.wait(1.0))
+            channel.stop(0.1)
+            for request in requests:
+                self.assertTrue(request.done())
+                self.assertRaises(ChannelClosed, request.result, 0)
+            self.assertRaises(ChannelClosed, channel.send, NAMELIST)
+        finally:
+            device.release.set()
+        # The stuck write goes through, then the writer exits without writing the rest
+        for thread in threading.enumerate():
+            if thread.name == 'command-writer':
+                thread.join(1.0)
+        device.close()
+        self.assertEqual(device.written, [NAMELIST])
+
+
+def listen_command(name):
+    payload = listen(name)
+    return payload[:1], payload[1:]
+
+
+class OutOfBandTest(unittest.TestCase):
+
+    def test_captured_answers(self):
+        for command, name in ((b'S', 'S.txt'), (b'n', '0x6E.txt')):
+            device = FakeDevice.from_cap(CAP, frames=itertools.repeat(DATA_FRAME), timeout=0.02)
+            device.write(command)
+            self.assertFalse(device.streaming)
+            self.assertEqual(device.read(256), capture(name))
+            self.assertEqual(device.read(256), b'')
+
+    def test_calibrate_has_no_answer(self):
+        device = FakeDevice.from_cap(CAP, frames=itertools.repeat(DATA_FRAME), timeout=0.02)
+        device.write(CALIBRATE)
+        self.assertTrue(device.streaming)
+        self.assertEqual(device.read(256), DATA_FRAME)
+
+
+if __name__ == '__main__':
+    unittest.main()
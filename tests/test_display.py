@@ -0,0 +1,109 @@
+from __future__ import print_function, division
+import contextlib
+import io
+import unittest
+
+from termapp.Display import Display
+
+KEY_ENTER, KEY_ESCAPE, KEY_BACKSPACE, KEY_DELETE, KEY_F1 = 343, 361, 263, 330, 265
+
+
+class Key(str):
+    """
+    Just enough of a blessed Keystroke
+    """
+
+    def __new__(cls, ucs=u'', code=None, name=None):
+        key = super(Key, cls).__new__(cls, ucs)
+        key.code = code
+        key.name = name
+        key.is_sequence = code is not None
+        return key
+
+
+class Style(str):
+    """
+    A blessed formatting string that formats nothing
+    """
+
+    def __call__(self, text=u'', *args):
+        return text
+
+
+class FakeTerminal(object):
+    """
+    Just enough of a blessed Terminal to run a Display: inkey() hands out the keys given,
+    then F1 to quit
+    """
+
+    KEY_ENTER, KEY_ESCAPE, KEY_BACKSPACE, KEY_DELETE = KEY_ENTER, KEY_ESCAPE, KEY_BACKSPACE, KEY_DELETE
+    width, height = 80, 24
+
+    def __init__(self, keys=()):
+        self.stream = io.StringIO()
+        self.keys = list(keys)
+
+    def __getattr__(self, name):
+        return Style()
+
+    @contextlib.contextmanager
+    def location(self, x=None, y=None):
+        yield
+
+    hidden_cursor = cbreak = fullscreen = location
+
+    def move(self, y, x):
+        return u''
+
+    def center(self, text, width=None):
+        return text
+
+    def inkey(self, timeout=None):
+        return self.keys.pop(0) if self.keys else Key(code=KEY_F1)
+
+
+def typed(text, end=Key(code=KEY_ENTER)):
+    return [Key(c) for c in text] + [end]
+
+
+class CommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.terminal = FakeTerminal()
+        self.display = Display(self.terminal)
+        self.calls = []
+        self.display.add_command('goto', lambda argument: self.calls.append(('goto', argument)))
+        self.display.add_command('help', lambda: self.calls.append(('help',)))
+
+    def command(self, keys):
+        self.terminal.keys = keys
+        self.display.run_command(self.display.readline())
+
+    def test_command_with_argument(self):
+        self.command(typed(u'goto 1200'))
+        self.assertEqual(self.calls, [('goto', u'1200')])
+
+    def test_command_alone(self):
+        self.command(typed(u'help'))
+        self.assertEqual(self.calls, [('help',)])
+
+    def test_backspace(self):
+        self.command(typed(u'goto 12', end=Key(code=KEY_BACKSPACE)) + typed(u'3'))
+        self.assertEqual(self.calls, [('goto', u'13')])
+
+    def test_cancel(self):
+        self.command(typed(u'goto 5', end=Key(code=KEY_ESCAPE)))
+        self.assertEqual(self.calls, [])
+
+    def test_unknown_command(self):
+        self.command(typed(u'jump 5'))
+        self.assertEqual(self.calls, [])
+
+    def test_command_from_the_key_loop(self):
+        self.terminal.keys = [Key(u'>')] + typed(u'goto 12')
+        self.display.start()
+        self.assertEqual(self.calls, [('goto', u'12')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+from __future__ import print_function, division
+import os
+import struct
+import unittest
+
+from MTS.Events import (AfrExcursionDetector, AuxDropoutDetector, EventEngine, FunctionTransitionDetector,
+                        WarmupDetector, detect_file)
+from MTS.Packet import PACKET_INTERVAL
+from MTS.stream import decode_frame
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+NORMAL, WARMUP, ERROR = 0b000, 0b100, 0b110
+
+
+def aux(value):
+    return ((value >> 7) << 8) | (value & 0x7F)
+
+
+def lc1(lambda_value, function=NORMAL, *aux_values):
+    # Multiplier 147
+    body = [0x4313 | (function << 10), aux(lambda_value) & 0x3F7F] + [aux(v) for v in aux_values]
+    return decode_frame(struct.pack('>{:d}H'.format(len(body) + 1), 0xB280 | len(body), *body))
+
+
+def run(detectors, packets):
+    return list(EventEngine(detectors).run(packets))
+
+
+class CaptureTest(unittest.TestCase):
+
+    def test_bundled_capture(self):
+        events = list(detect_file(os.path.join(DATA, 'openlog-20160710-001.TXT')))
+        self.assertEqual(len(events), 259)
+        self.assertEqual([(e.packet, e.kind) for e in events[:5]],
+                         [(0, 'warmup'), (7, 'function'), (14, 'function'), (14, 'warmup'), (367, 'rich')])
+        self.assertEqual(events[1].detail, {'from': 'Warmup', 'to': 'Error', 'code': 9})
+        self.assertEqual((events[3].detail['from_percent'], events[3].detail['packets']), (1.3, 300))
+        self.assertAlmostEqual(events[3].detail['duration'], 300 * PACKET_INTERVAL)
+        self.assertAlmostEqual(events[4].time, 367 * PACKET_INTERVAL)
+        self.assertEqual(events[4].detail['peak'], 11.0985)
+        self.assertEqual(sorted(set(e.kind for e in events)), ['function', 'lean', 'rich', 'warmup'])
+        self.assertEqual([e.packet for e in events], sorted(e.packet for e in events))
+
+
+class DetectorTest(unittest.TestCase):
+
+    def test_warmup_closes_at_end_of_stream(self):
+        events = run([WarmupDetector()], [lc1(100, WARMUP)] * 3 + [lc1(500)] + [lc1(200, WARMUP)] * 2)
+        self.assertEqual([(e.packet, e.detail['packets'], e.detail['from_percent']) for e in events],
+                         [(0, 3, 10.0), (4, 2, 20.0)])
+        self.assertAlmostEqual(events[1].detail['duration'], 2 * PACKET_INTERVAL)
+
+    def test_function_transitions(self):
+        events = run([FunctionTransitionDetector()], [lc1(500), lc1(9, ERROR), lc1(9, ERROR), lc1(500)])
+        self.assertEqual([(e.packet, e.detail) for e in events],
+                         [(1, {'from': 'Normal', 'to': 'Error', 'code': 9}), (3, {'from': 'Error', 'to': 'Normal'})])
+
+    def test_excursions_shorter_than_min_packets_are_dropped(self):
+        # AFR 14.7 at lambda 500, 22.05 at 1000, 7.35 at 0
+        packets = [lc1(500), lc1(1000), lc1(1100), lc1(1000), lc1(500), lc1(0), lc1(0), lc1(500)]
+        events = run([AfrExcursionDetector(min_packets=3)], packets)
+        self.assertEqual([(e.kind, e.packet, e.detail['packets']) for e in events], [('lean', 1, 3)])
+        self.assertAlmostEqual(events[0].detail['peak'], 1600 * 147 / 10000)
+        events = run([AfrExcursionDetector(min_packets=2)], packets)
+        self.assertEqual([(e.kind, e.packet) for e in events], [('lean', 1), ('rich', 5)])
+
+    def test_aux_dropout(self):
+        packets = [lc1(500, NORMAL, 300), lc1(500, NORMAL, 0), lc1(500), lc1(500, NORMAL, 300), lc1(500, NORMAL, 0)]
+        events = run([AuxDropoutDetector(0)], packets)
+        self.assertEqual([(e.packet, e.detail['channel'], e.detail['packets']) for e in events], [(1, 0, 2)])
+        self.assertAlmostEqual(events[0].detail['duration'], 2 * PACKET_INTERVAL)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+from __future__ import print_function, division
+import struct
+import unittest
+
+from MTS.Packet import format_packet
+from MTS.stream import decode_frame
+
+
+def frame(*body):
+    # Data header counting the body words
+    return struct.pack('>{:d}H'.format(len(body) + 1), 0xB280 | len(body), *body)
+
+
+AUX = (0x0312, 0x0045, 0x0000, 0x077F)
+AUX_VALUES = [0x0192, 0x0045, 0x0000, 0x03FF]
+# Function, lambda and battery words, then the aux channels
+LM1 = (0x8113, 0x0A55, 0x0F00) + AUX
+LC1_BATTERY = (0x4313, 0x0A55, 0x0F00) + AUX
+LC1 = (0x4313, 0x0A55) + AUX
+
+
+class WordsTest(unittest.TestCase):
+
+    def assertRoundTrip(self, body, aux):
+        packet = decode_frame(frame(*body))
+        self.assertEqual(packet.words(), [0xB280 | len(body)] + list(body))
+        self.assertEqual([a.aux() for a in packet.aux_channels()], aux)
+        words = '-'.join('{:04X}'.format(word) for word in packet.words())
+        self.assertIn(' 0x{} '.format(words), format_packet(0, packet))
+
+    def test_lm1(self):
+        packet = decode_frame(frame(*LM1))
+        self.assertTrue(packet.is_lm1())
+        self.assertRoundTrip(LM1, AUX_VALUES)
+
+    def test_lc1_with_battery(self):
+        self.assertRoundTrip(LC1_BATTERY, AUX_VALUES)
+
+    def test_lc1(self):
+        self.assertRoundTrip(LC1, AUX_VALUES)
+
+    def test_lm1_without_aux(self):
+        self.assertRoundTrip(LM1[:3], [])
+
+    def test_aux_only(self):
+        self.assertRoundTrip(AUX, AUX_VALUES)
+
+
+class DataLineTest(unittest.TestCase):
+
+    def test_short_chain(self):
+        # Packet 225 of data/openlog-20160716-002.TXT: warmup, three aux channels
+        body = (0x5313, 0x006D, 0xA289, 0x0173, 0xA2A2, 0xA285)
+        self.assertEqual(format_packet(225, decode_frame(frame(*body))),
+                         '  225 0xB286-5313-006D-A289-0173-A2A2-A285 W       109% 02430 rpm 00290 raw 00261 raw')
+
+    def test_lm1_with_three_aux_words(self):
+        line = format_packet(0, decode_frame(frame(*LM1[:6])))
+        self.assertTrue(line.endswith(' 04020 rpm 00069 raw 00000 raw'), line)
+
+    def test_lambda_without_aux(self):
+        self.assertTrue(format_packet(0, decode_frame(frame(*LC1[:2]))).endswith(' N AFR=27.416'))
+
+    def test_all_four_channels(self):
+        self.assertTrue(format_packet(0, decode_frame(frame(*LC1))).endswith(
+            ' 04020 rpm 00069 raw 00000 raw 01023 raw'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+from __future__ import print_function, division
+import struct
+import sys
+import unittest
+
+from MTS.Columns import Columns
+from MTS.Query import Query, QueryError
+
+
+def frame(*body):
+    # Data header counting the body words
+    return struct.pack('>{:d}H'.format(len(body) + 1), 0xB280 | len(body), *body)
+
+
+def aux(value):
+    return ((value >> 7) << 8) | (value & 0x7F)
+
+
+def lc1(lambda_value, *aux_values):
+    # Normal function, multiplier 147
+    return frame(0x4313, aux(lambda_value) & 0x3F7F, *[aux(v) for v in aux_values])
+
+
+def columns():
+    result = Columns()
+    result.extend([
+        lc1(500, 300, 0),  # AFR 14.7
+        lc1(1000, 300, 100),  # AFR 22.05
+        frame(aux(50), aux(25)),  # no lambda
+    ])
+    return result
+
+
+class QueryTest(unittest.TestCase):
+
+    def ranges(self, expression):
+        return Query(expression).ranges(columns())
+
+    def test_divide_by_zero_is_missing(self):
+        self.assertEqual(self.ranges('aux1 / aux2 > 2'), [(1, 2)])
+        self.assertEqual(self.ranges('aux1 / aux2 == None'), [(0, 1)])
+        self.assertEqual(self.ranges('aux1 / 0 != None'), [])
+
+    def test_bool_logic_over_floats(self):
+        self.assertEqual(self.ranges('afr > 14 and aux1'), [(0, 2)])
+        self.assertEqual(self.ranges('afr < 15 or aux2 < 30'), [(0, 1), (2, 3)])
+        self.assertEqual(self.ranges('not afr'), [(2, 3)])
+
+    def test_arithmetic(self):
+        self.assertEqual(self.ranges('-aux2 < -50'), [(1, 2)])
+        self.assertEqual(self.ranges('aux1.volts * 2 > 2'), [(0, 2)])
+
+    def test_function_names_and_missing(self):
+        self.assertEqual(self.ranges("function == 'Normal'"), [(0, 2)])
+        self.assertEqual(self.ranges('function == None'), [(2, 3)])
+        self.assertEqual(self.ranges('lambda_value >= 1000'), [(1, 2)])
+        self.assertEqual(self.ranges('aux3 == None'), [(0, 3)])
+
+    def test_errors(self):
+        bad = ["aux1 + 'x'", "-'x'", 'lambda > 1', 'afr >', 'rpm > 1', 'afr < None', "function == 'Fast'"]
+        if sys.version_info[0] >= 3:
+            bad.append("afr > 'x'")
+        for expression in bad:
+            with self.assertRaises(QueryError):
+                self.ranges(expression)
+
+    def test_lambda_hint(self):
+        with self.assertRaises(QueryError) as raised:
+            Query('lambda > 1')
+        self.assertIn('lambda_value', str(raised.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
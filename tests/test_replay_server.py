@@ -0,0 +1,98 @@
+from __future__ import print_function, division
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import time
+import unittest
+
+from MTS.ReplayServer import ReplayServer
+from MTS.stream import FrameParser
+
+FRAMES = 40
+
+
+def frame(n):
+    # Data header, 2 words: two aux channels carrying n
+    return struct.pack('>3H', 0xB282, n & 0x007F, (n >> 7) & 0x007F)
+
+
+class ReplayServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.frames = [frame(n) for n in range(FRAMES)]
+        unix_path = os.path.join(self.directory, 'replay.sock') if hasattr(socket, 'AF_UNIX') else None
+        self.server = ReplayServer(self.frames, address=('127.0.0.1', 0), unix_path=unix_path, interval=20.0)
+
+    def tearDown(self):
+        self.server.stop(5.0)
+        shutil.rmtree(self.directory)
+
+    def connect(self):
+        return socket.create_connection(self.server.address, 5.0)
+
+    def connect_unix(self):
+        if self.server.unix_path is None:
+            return self.connect()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5.0)
+        sock.connect(self.server.unix_path)
+        return sock
+
+    def receive(self, sock):
+        """
+        Everything the server sends until it hangs up, as frames
+        """
+        data = bytearray()
+        while 1:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data.extend(chunk)
+        sock.close()
+        frames = FrameParser().feed(bytes(data))
+        # Whole frames from the first byte to the last
+        self.assertEqual(b''.join(frames), bytes(data))
+        return frames
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertTrue(condition())
+
+    def test_clients_get_the_same_frames(self):
+        clients = [self.connect(), self.connect_unix()]
+        self.server.start()
+        self.wait_for(lambda: self.server.accepted == 2)
+        received = [self.receive(sock) for sock in clients]
+        self.server.join(5.0)
+        self.assertEqual(received[0], received[1])
+        # Both were connected from the first tick or so, and the stream ran to its end
+        self.assertGreater(len(received[0]), FRAMES - 5)
+        self.assertEqual(received[0], self.frames[-len(received[0]):])
+        self.assertEqual((self.server.frames, self.server.disconnected, self.server.dropped_slow), (FRAMES, 2, 0))
+
+    def test_late_client_starts_on_a_frame(self):
+        early = self.connect()
+        self.server.start()
+        self.wait_for(lambda: self.server.frames >= FRAMES // 2)
+        late = self.connect_unix()
+        first, second = self.receive(early), self.receive(late)
+        self.server.join(5.0)
+        self.assertTrue(0 < len(second) <= FRAMES // 2)
+        self.assertEqual(second, first[-len(second):])
+        self.assertEqual(second, self.frames[-len(second):])
+
+    def test_unix_socket_is_removed(self):
+        if self.server.unix_path is None:
+            self.skipTest('no Unix sockets here')
+        self.server.start()
+        self.server.stop(5.0)
+        self.assertFalse(os.path.exists(self.server.unix_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+from __future__ import print_function, division
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from MTS.FrameIndex import FrameIndex
+from MTS.Session import Session
+from MTS.stream import FrameParser
+
+
+def frame(n):
+    # Data header, 2 words: two aux channels carrying n
+    return struct.pack('>3H', 0xB282, n & 0x007F, (n >> 7) & 0x007F)
+
+
+class SplitHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.frames = [frame(n) for n in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_split(self, cut):
+        data = b''.join(self.frames)
+        paths = []
+        for name, part in (('a.ISP2', data[:cut]), ('b.ISP2', data[cut:])):
+            paths.append(os.path.join(self.directory, name))
+            with io.open(paths[-1], mode='wb') as out:
+                out.write(part)
+        return Session(paths)
+
+    def test_partial_offset_of_lone_header_byte(self):
+        parser = FrameParser()
+        parser.feed(b''.join(self.frames)[:13])
+        self.assertEqual(parser.partial_offset(), 12)
+
+    def test_lone_non_header_byte_is_not_partial(self):
+        parser = FrameParser()
+        parser.feed(self.frames[0] + b'\x00')
+        self.assertIsNone(parser.partial_offset())
+
+    def test_split_one_byte_into_header(self):
+        session = self.write_split(2 * len(self.frames[0]) + 1)
+        self.assertEqual(len(session), len(self.frames))
+        self.assertEqual([first for _, first, _ in session.file_offsets()], [0, 3])
+        for n, expected in enumerate(self.frames):
+            self.assertEqual(session.frame(n), expected)
+            self.assertEqual(session.locate(n), (0, n) if n < 3 else (1, n - 3))
+
+    def test_split_mid_frame(self):
+        session = self.write_split(2 * len(self.frames[0]) + 3)
+        self.assertEqual(len(session), len(self.frames))
+        for n, expected in enumerate(self.frames):
+            self.assertEqual(session.frame(n), expected)
+
+
+class SidecarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.ISP2')
+        with io.open(self.path, mode='wb') as out:
+            out.write(b''.join(frame(n) for n in range(5)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_readers_leave_no_sidecar(self):
+        session = Session([self.path])
+        self.assertEqual(len(session), 5)
+        self.assertEqual(session.frame(4), frame(4))
+        self.assertEqual(os.listdir(self.directory), ['capture.ISP2'])
+
+    def test_saved_sidecar_is_used(self):
+        FrameIndex.for_file(self.path, save=True)
+        self.assertTrue(os.path.exists(FrameIndex.sidecar_path(self.path)))
+        self.assertEqual(list(FrameIndex.for_file(self.path).offsets), [0, 6, 12, 18, 24])
+
+
+if __name__ == '__main__':
+    unittest.main()
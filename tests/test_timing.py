@@ -0,0 +1,118 @@
+from __future__ import print_function, division
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from MTS.Cache import DecodeCache
+from MTS.Capture import CapturePipeline, Sink
+from MTS.Columns import decode_file
+from MTS.Dedup import RunSequence
+from MTS.Packet import PACKET_INTERVAL
+from MTS.Query import search
+from MTS.Session import Session
+from MTS.Timing import BYTE_NS, PacketClock, packet_clock, save_timestamps, sidecar_path, stamp_frames
+
+# Data header, 2 words: 6 bytes
+FRAME = struct.pack('>3H', 0xB282, 0x0012, 0x0034)
+
+
+class ChunkedInput(object):
+    """
+    Hands out the given chunks, one per read
+    """
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    def read(self, size):
+        return self._chunks.pop(0) if self._chunks else b''
+
+
+class StampSink(Sink):
+
+    def __init__(self):
+        super(StampSink, self).__init__('stamps', maxsize=0)
+        self.stamps = []
+
+    def handle(self, index, received, frame):
+        self.stamps.append(received)
+
+
+class StampTest(unittest.TestCase):
+
+    def test_frames_of_one_read_are_back_dated(self):
+        # Three frames and the first byte of a fourth, read at once
+        stamps = stamp_frames(10 ** 9, [FRAME] * 3, [0, 6, 12], 19)
+        self.assertEqual(stamps, [10 ** 9 - int(13 * BYTE_NS), 10 ** 9 - int(7 * BYTE_NS), 10 ** 9 - int(BYTE_NS)])
+
+    def test_stamps_never_go_back(self):
+        self.assertEqual(stamp_frames(1000, [FRAME], [0], 6, previous=2000), [2000])
+
+    def test_pipeline_stamps_each_frame(self):
+        sink = StampSink()
+        pipeline = CapturePipeline(ChunkedInput([FRAME * 4, FRAME[:3], FRAME[3:] + FRAME]), sinks=[sink])
+        pipeline.run()
+        self.assertEqual(len(sink.stamps), 6)
+        self.assertEqual(len(set(sink.stamps[:4])), 4)
+        self.assertEqual(sink.stamps, sorted(sink.stamps))
+        self.assertAlmostEqual(sink.stamps[1] - sink.stamps[0], len(FRAME) * BYTE_NS, delta=1)
+
+
+class PacketClockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.ISP2')
+        with io.open(self.path, mode='wb') as out:
+            out.write(FRAME * 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_without_stamps(self):
+        clock = packet_clock()
+        self.assertEqual([next(clock) for _ in range(3)], [0.0, PACKET_INTERVAL, 2 * PACKET_INTERVAL])
+
+    def test_runs_on_after_stamps(self):
+        clock = packet_clock([5 * 10 ** 6, 6 * 10 ** 6])
+        self.assertEqual([next(clock) for _ in range(3)], [0.0, 1.0, 1.0 + PACKET_INTERVAL])
+
+    def test_query_reports_the_time_column(self):
+        stamps = [n * 100 * 10 ** 6 for n in range(5)]
+        save_timestamps(sidecar_path(self.path), stamps)
+        self.assertEqual(list(decode_file(self.path).time()), [0.0, 100.0, 200.0, 300.0, 400.0])
+        (path, first, stop, start_ms, stop_ms), = search([self.path], 'time >= 200 and time < 400',
+                                                          cache=DecodeCache(os.path.join(self.directory, 'cache')))
+        self.assertEqual((first, stop, start_ms, stop_ms), (2, 4, 200.0, 400.0))
+
+    def test_random_access_matches_the_clock(self):
+        for stamps in (None, [5 * 10 ** 6, 6 * 10 ** 6, 9 * 10 ** 6]):
+            clock, times = PacketClock(stamps), packet_clock(stamps)
+            self.assertEqual([clock.time_of(n) for n in range(8)], [next(times) for _ in range(8)])
+
+    def test_packet_at_time(self):
+        clock = PacketClock([0, 10 ** 6, 300 * 10 ** 6])
+        self.assertEqual([clock.packet_at_time(ms) for ms in (-5.0, 0.0, 0.5, 1.0, 299.0, 300.0)], [0, 0, 0, 1, 1, 2])
+        self.assertEqual(clock.packet_at_time(300.0 + 2.5 * PACKET_INTERVAL), 4)
+        self.assertEqual(PacketClock().packet_at_time(2.5 * PACKET_INTERVAL), 2)
+
+    def test_session_and_runs_use_the_stamps(self):
+        stamps = [n * 100 * 10 ** 6 for n in range(5)]
+        save_timestamps(sidecar_path(self.path), stamps)
+        session = Session([self.path])
+        columns = list(decode_file(self.path).time())
+        self.assertEqual([time for _, time, _ in session.packets()], columns)
+        self.assertEqual([session.time_of(n) for n in range(5)], columns)
+        self.assertEqual(session.packet_at_time(250.0), 2)
+        self.assertEqual(session.file_offsets(), [(self.path, 0, 0.0)])
+        runs = RunSequence.from_frames([FRAME] * 5, stamps=stamps)
+        self.assertEqual([runs.time_of(n) for n in range(5)], columns)
+        # Without a sidecar, or for several files, packets are PACKET_INTERVAL apart
+        self.assertEqual(Session([self.path, self.path]).time_of(3), 3 * PACKET_INTERVAL)
+
+
+if __name__ == '__main__':
+    unittest.main()